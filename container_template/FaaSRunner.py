@@ -52,11 +52,24 @@ def callThread(thread_id, runs, function, myPayloads, experiment_name, tags):
         callPostProcessor(response, thread_id, i, payload)
         
         
-def callProcess(http_endpoint, runs, myPayloads):
+#
+# Call an HTTP endpoint sequentially. With reuse_connections one keep-alive session
+# is used for all calls, otherwise each call opens a new connection.
+#
+def callProcess(http_endpoint, runs, myPayloads, reuse_connections=True, timeout=(10, 450)):
+    session = None
+    if reuse_connections:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
     for i in range(0, runs): 
         response = None
         startTime = time.time()
-        response = requests.post(http_endpoint, json=myPayloads[i])
+        if session is not None:
+            response = session.post(http_endpoint, json=myPayloads[i], timeout=timeout)
+        else:
+            response = requests.post(http_endpoint, json=myPayloads[i], headers={'connection': 'close'}, timeout=timeout)
         obj = response.json()
         obj["callEndTime"] = time.time()
         obj["callStartTime"] = startTime
@@ -123,7 +136,9 @@ def fast_experiment(http_endpoint,
                     experiment_name="fast_experiment", 
                     start_delay=5,
                     end_delay=5,
-                    tags={}):
+                    tags={},
+                    reuse_connections=True,
+                    timeout=(10, 450)):
     global run_results
     run_results = []
     
@@ -162,7 +177,7 @@ def fast_experiment(http_endpoint,
                 time.sleep(start_delay * 0.9)
                 while time.time() < start_time:
                     continue
-                callProcess(http_endpoint, runs_per_process, myList)
+                callProcess(http_endpoint, runs_per_process, myList, reuse_connections, timeout)
                 time.sleep(end_delay)
                 
                 # Save all runs
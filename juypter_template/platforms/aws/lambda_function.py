@@ -1,3 +1,14 @@
+import os
+
+# Set the SAAF_TRACE_IMPORTS environment variable to record the import time of each
+# module on cold starts. The first invocation of a container returns the results.
+if (os.environ.get('SAAF_TRACE_IMPORTS', None) != None):
+    try:
+        import SAAF
+        SAAF.traceImports()
+    except ImportError:
+        pass
+
 import handler
 import json
 
@@ -1,3 +1,11 @@
+import os
+
+# Set the SAAF_TRACE_IMPORTS environment variable to record the import time of each
+# module on cold starts. The first invocation of a container returns the results.
+if (os.environ.get('SAAF_TRACE_IMPORTS', None) != None):
+    import Inspector
+    Inspector.traceImports()
+
 import handler
 import json
 
@@ -3,6 +3,12 @@ import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
 
+# Set the SAAF_TRACE_IMPORTS environment variable to record the import time of each
+# module on cold starts. The first invocation of a container returns the results.
+if (os.environ.get('SAAF_TRACE_IMPORTS', None) != None):
+    import Inspector
+    Inspector.traceImports()
+
 import json
 import logging
 import azure.functions as func
@@ -1,11 +1,26 @@
+import array
+import base64
+import gc
+import hashlib
 import json
 import logging
+import math
 import os
+import random
 import subprocess
 import re
 import uuid
 import shlex
+import sys
+import threading
 import time
+import tracemalloc
+import zlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 #
 # Execute a bash command and get the output.
@@ -16,12 +31,674 @@ import time
 def runCommand(command):
     return os.popen(command).read()
 
+#
+# Read a file without spawning a process.
+#
+# @param path The path of the file to read.
+# @return The contents of the file or an empty string if it cannot be read, like cat.
+#
+def readFile(path):
+    try:
+        with open(path, 'r') as file:
+            return file.read()
+    except Exception:
+        return ''
+
+#
+# Get the cgroup cpu line used to identify the VM. Equivalent to
+# 'cat /proc/self/cgroup | grep 2:cpu' with newlines removed.
+#
+# @param useShell Whether to fork a shell to run the command.
+#
+def getCGroupCPU(useShell = False):
+    if useShell:
+        return runCommand('cat /proc/self/cgroup | grep 2:cpu').replace('\n', '')
+    lines = readFile('/proc/self/cgroup').split('\n')
+    return ''.join([line for line in lines if '2:cpu' in line])
+
+#
+# Get the hypervisor uuid. Equivalent to 'cat /sys/hypervisor/uuid'.
+#
+# @param useShell Whether to fork a shell to run the command.
+#
+def getHypervisorUUID(useShell = False):
+    if useShell:
+        return runCommand('cat /sys/hypervisor/uuid').strip()
+    return readFile('/sys/hypervisor/uuid').strip()
+
+#
+# Get the kernel information. Equivalent to 'uname -a' on GNU/Linux. Fedora, RHEL
+# and Amazon Linux patch coreutils so that 'uname -a' also prints the processor and
+# hardware platform, which are the machine name, while Debian based systems leave
+# them out.
+#
+# @param useShell Whether to fork a shell to run the command.
+#
+def getKernelVersion(useShell = False):
+    if useShell:
+        return runCommand('uname -a').replace('\n', '')
+    uname = os.uname()
+    fields = list(uname)
+    osRelease = readFile('/etc/os-release')
+    distributions = ' '.join(re.findall(r'^ID(?:_LIKE)?="?([^"\n]*)', osRelease, re.MULTILINE)).split()
+    if any(name in ('fedora', 'rhel', 'centos', 'amzn') for name in distributions):
+        fields += [uname.machine, uname.machine]
+    return ' '.join(fields) + ' GNU/Linux'
+
+#
+# A read only /proc file that stays open and is re-read with pread into a
+# reusable buffer instead of being opened, read and closed on every poll.
+#
+class ProcFile:
+
+    #
+    # @param path The path of the file to keep open.
+    # @param singleRead Whether the kernel returns the whole file in one read when
+    #                   the buffer is large enough, see single_read_files.
+    #
+    def __init__(self, path, singleRead = False):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buffer = bytearray(16384)
+        self.length = 0
+        self.singleRead = singleRead
+
+    #
+    # Re-read the file from the start, growing the buffer if the file does not fit.
+    # Most /proc files return about one page per read, so reads continue at
+    # increasing offsets until the end of the file. Files that are returned in one
+    # read stop at the first read that does not fill the buffer, saving a read
+    # that would generate the whole file again.
+    #
+    # @return The number of bytes read.
+    #
+    def read(self):
+        self.length = 0
+        while True:
+            if self.length == len(self.buffer):
+                self.buffer.extend(bytearray(len(self.buffer)))
+            count = os.preadv(self.fd, [memoryview(self.buffer)[self.length:]], self.length)
+            self.length += count
+            if count == 0 or (self.singleRead and self.length < len(self.buffer)):
+                return self.length
+
+    #
+    # Get the integer following a label without splitting the whole file. Only a
+    # few bytes after the label are split, so long lines such as intr in /proc/stat
+    # are cheap.
+    #
+    # @param label The bytes before the value, e.g. b'MemFree:'.
+    # @return The value or None if the label does not exist.
+    #
+    def value(self, label):
+        start = self.buffer.find(label, 0, self.length)
+        if start == -1:
+            return None
+        start += len(label)
+        return int(self.buffer[start:min(start + 64, self.length)].split()[0])
+
+    #
+    # Get the first line of the last read as a list of fields.
+    #
+    def firstLine(self):
+        return self.buffer[:self.buffer.find(b'\n', 0, self.length)].split()
+
+    #
+    # Get the contents of the last read as a string.
+    #
+    def text(self):
+        return self.buffer[:self.length].decode('utf-8')
+
+    def close(self):
+        os.close(self.fd)
+
+#
+# Get a persistent ProcFile for a path, re-read with the latest contents. Files
+# stay open for the lifetime of the container.
+#
+# @param path The path of the /proc file.
+# @return The ProcFile.
+#
+def readProcFile(path):
+    global proc_files
+    if path not in proc_files:
+        proc_files[path] = ProcFile(path, path in single_read_files)
+    proc_files[path].read()
+    return proc_files[path]
+
+#
+# Read the CPU times in ms and the counters of /proc/stat. Only the per CPU lines
+# are split. The counters are matched in one pass over the buffer, so the long intr
+# and softirq lines, of which only the totals are kept, are never split.
+#
+# @return A dictionary with cpuTotal, one entry per CPU and the counters.
+#
+def readCPUStats():
+    tick_rate = 1000 / ticks_per_second
+    stat = readProcFile('/proc/stat')
+    data = {}
+
+    end = stat.buffer.find(b'\nintr ', 0, stat.length)
+    for line in stat.buffer[:end if end != -1 else stat.length].split(b'\n'):
+        values = line.split()
+        if len(values) > 1 and values[0].startswith(b'cpu'):
+            title = 'cpuTotal' if values[0] == b'cpu' else values[0].decode('ascii')
+            data[title] = {metric: int(value) * tick_rate for metric, value in zip(cpu_metrics, values[1:])}
+
+    for label, value in stat_counters.findall(stat.buffer, 0, stat.length):
+        data[label.decode('ascii')] = int(value)
+    return data
+
+#
+# Read memory statistics in kB of /proc/meminfo and /proc/self/status by label.
+#
+# @return A dictionary with one entry per label in memory_labels and status_labels.
+#
+def readMemoryStats():
+    data = {}
+    for path, labels in (('/proc/meminfo', memory_labels), ('/proc/self/status', status_labels)):
+        procFile = readProcFile(path)
+        for label in labels:
+            value = procFile.value(label)
+            if value != None:
+                data[label.strip().rstrip(b':').decode('ascii')] = value
+    return data
+
+#
+# Measure the cost in microseconds of the /proc reads done by pollCPUStats,
+# pollMemoryStats and inspectMemory, compared to opening, reading and splitting
+# each file as SAAF did before ProcFile.
+#
+# @param iterations The number of calls of each method.
+# @return Microseconds per call for each poll and method.
+#
+def benchmarkPolling(iterations = 1000):
+    tick_rate = 1000 / ticks_per_second
+
+    def readFileLines(path):
+        with open(path, 'r') as file:
+            return file.read().split('\n')
+
+    def openCPUStats():
+        data = {}
+        lines = readFileLines('/proc/stat')
+        lines[0] = lines[0].replace("cpu  ", "cpuTotal ")
+        for line in lines:
+            values = line.split(" ")
+            title = values[0].strip()
+            if ("cpu" in title):
+                data[title] = {metric: int(values[index + 1]) * tick_rate for index, metric in enumerate(cpu_metrics)}
+            elif len(values) >= 2:
+                data[title] = int(values[1])
+        return data
+
+    def openMemoryStats():
+        data = {}
+        for line in readFileLines('/proc/meminfo') + readFileLines('/proc/self/status'):
+            values = line.split()
+            if len(values) >= 2 and values[1].isdigit():
+                data[values[0].rstrip(':')] = int(values[1])
+        return data
+
+    def openMemory():
+        lines = readFileLines('/proc/meminfo')
+        data = [int(lines[0].replace("MemTotal:", "").replace(" kB", "").strip()),
+                int(lines[1].replace("MemFree:", "").replace(" kB", "").strip())]
+        for line in readFileLines('/proc/vmstat'):
+            if 'pgfault' in line or 'pgmajfault' in line:
+                data.append(int(line.split(' ')[1]))
+        return data
+
+    def procMemory():
+        data = readMemoryStats()
+        vmStat = readProcFile('/proc/vmstat')
+        return [data['MemTotal'], data['MemFree'], vmStat.value(b'\npgfault '), vmStat.value(b'\npgmajfault ')]
+
+    methods = {
+        "pollCPUStats": (openCPUStats, readCPUStats),
+        "pollMemoryStats": (openMemoryStats, readMemoryStats),
+        "inspectMemory": (openMemory, procMemory)
+    }
+    results = {}
+    for name in methods:
+        timings = []
+        for method in methods[name]:
+            method()
+            startTime = time.perf_counter()
+            for i in range(iterations):
+                method()
+            timings.append(round((time.perf_counter() - startTime) / iterations * 1000000, 2))
+        results[name] = {"openReadSplit": timings[0], "pread": timings[1]}
+    return results
+
+#
+# Find the cgroup files that describe the CPU quota, throttling and memory limit
+# of this process. cgroup v2 is used if the cpu controller is enabled on it,
+# otherwise the v1 cpu and memory hierarchies are used.
+#
+# @return A dictionary with the cgroup version and paths of the files that exist.
+#
+def findCGroupFiles():
+    paths = {}
+    for line in readFile('/proc/self/cgroup').split('\n'):
+        parts = line.split(':', 2)
+        if len(parts) == 3:
+            for controller in parts[1].split(','):
+                paths[controller] = parts[2]
+
+    # The cgroup path may not be visible inside a container namespace, so the
+    # root of each hierarchy is tried as well.
+    def locate(roots, path, name):
+        for root in roots:
+            for directory in [root + path.rstrip('/'), root]:
+                if os.path.isfile(directory + '/' + name):
+                    return directory
+        return None
+
+    files = {}
+    if '' in paths:
+        directory = locate(['/sys/fs/cgroup', '/sys/fs/cgroup/unified'], paths[''], 'cpu.max')
+        if (directory != None):
+            files['version'] = 2
+            files['cpuStat'] = directory + '/cpu.stat'
+            files['cpuMax'] = directory + '/cpu.max'
+            files['memoryCurrent'] = directory + '/memory.current'
+            files['memoryMax'] = directory + '/memory.max'
+    if 'version' not in files and 'cpu' in paths:
+        directory = locate(['/sys/fs/cgroup/cpu', '/sys/fs/cgroup/cpu,cpuacct'], paths['cpu'], 'cpu.stat')
+        if (directory != None):
+            files['version'] = 1
+            files['cpuStat'] = directory + '/cpu.stat'
+            files['cpuQuota'] = directory + '/cpu.cfs_quota_us'
+            files['cpuPeriod'] = directory + '/cpu.cfs_period_us'
+        directory = locate(['/sys/fs/cgroup/memory'], paths.get('memory', '/'), 'memory.usage_in_bytes')
+        if (directory != None):
+            files['memoryCurrent'] = directory + '/memory.usage_in_bytes'
+            files['memoryMax'] = directory + '/memory.limit_in_bytes'
+    return {key: value for key, value in files.items() if key == 'version' or os.path.isfile(value)}
+
+#
+# Aggregated timings of every execution of a span at one position in the span tree.
+# Times are in ns.
+#
+class SpanNode:
+    __slots__ = ["count", "total", "child", "minimum", "maximum", "children"]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.child = 0
+        self.minimum = 0
+        self.maximum = 0
+        self.children = {}
+
+    #
+    # Convert the node and its children into the compact output form:
+    # [count, totalTime, selfTime, minTime, maxTime] with a sixth element holding
+    # the children by name if there are any.
+    #
+    def export(self):
+        data = [self.count, self.total, self.total - self.child, self.minimum, self.maximum]
+        if self.children:
+            data.append({name: node.export() for name, node in self.children.items() if node.count > 0})
+        return data
+
+#
+# A named span returned by Inspector.span. Used as a context manager or decorator.
+# One Span is created per name, so entering a span inside a loop only updates the
+# existing SpanNode.
+#
+class Span:
+
+    def __init__(self, name, nodes, starts):
+        self.name = name
+        self.nodes = nodes
+        self.starts = starts
+
+    def __enter__(self):
+        parent = self.nodes[-1]
+        node = parent.children.get(self.name)
+        if node is None:
+            node = parent.children[self.name] = SpanNode()
+        self.nodes.append(node)
+        self.starts.append(time.perf_counter_ns())
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        elapsed = time.perf_counter_ns() - self.starts.pop()
+        node = self.nodes.pop()
+        if node.count == 0 or elapsed < node.minimum:
+            node.minimum = elapsed
+        if elapsed > node.maximum:
+            node.maximum = elapsed
+        node.count += 1
+        node.total += elapsed
+        self.nodes[-1].child += elapsed
+        return False
+
+    def __call__(self, function):
+        def wrapper(*args, **kwargs):
+            with self:
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+#
+# Start recording the time taken by every module import, like python -X importtime
+# but captured in process. Call this from a platform bridge before importing the
+# function handler. The first Inspector of the container stops the tracer in
+# finish() and adds the slowest imports to its output.
+#
+def traceImports():
+    global import_times
+    global import_original
+    if (import_original != None):
+        return
+    import importlib._bootstrap as bootstrap
+    import_original = bootstrap._find_and_load
+    stack = []
+
+    # _find_and_load is called once for each module that is not yet in sys.modules.
+    def tracedFindAndLoad(name, importFunction):
+        global import_total
+        stack.append(0)
+        startTime = time.perf_counter_ns()
+        try:
+            return import_original(name, importFunction)
+        finally:
+            elapsed = time.perf_counter_ns() - startTime
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            else:
+                import_total += elapsed
+            import_times[name] = (elapsed, elapsed - children)
+
+    bootstrap._find_and_load = tracedFindAndLoad
+
+#
+# Stop recording import times.
+#
+def stopTraceImports():
+    global import_original
+    if (import_original == None):
+        return
+    import importlib._bootstrap as bootstrap
+    bootstrap._find_and_load = import_original
+    import_original = None
+
+#
+# Garbage collector callback shared by every Inspector. Pause times in ns are
+# added to gc_counters, the counters of the Inspector that last called inspectGC.
+#
+def recordGC(phase, info):
+    counters = gc_counters
+    if counters == None:
+        return
+    if phase == "start":
+        counters["start"] = time.perf_counter_ns()
+    else:
+        pause = time.perf_counter_ns() - counters["start"]
+        generation = info["generation"]
+        counters["collections"][generation] += 1
+        counters["collected"][generation] += info["collected"]
+        counters["pauseTime"][generation] += pause
+        if pause > counters["pauseMax"][generation]:
+            counters["pauseMax"][generation] = pause
+
+#
+# A streaming histogram with logarithmic buckets. Bucket i holds values in
+# [1.1^i, 1.1^(i + 1)) so percentiles have at most 10% relative error. Values of
+# zero or less are counted separately. Histograms of the same metric can be merged
+# by adding their bucket counts.
+#
+class Histogram:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minimum = 0
+        self.maximum = 0
+        self.zeros = 0
+        self.buckets = {}
+
+    def add(self, value):
+        if self.count == 0 or value < self.minimum:
+            self.minimum = value
+        if self.count == 0 or value > self.maximum:
+            self.maximum = value
+        self.count += 1
+        self.total += value
+        if value <= 0:
+            self.zeros += 1
+        else:
+            bucket = math.floor(math.log(value) / math.log(1.1))
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    #
+    # Estimate a percentile from the buckets.
+    #
+    # @param percent The percentile between 0 and 100.
+    # @return The lower bound of the bucket holding the percentile.
+    #
+    def percentile(self, percent):
+        rank = math.ceil(self.count * percent / 100)
+        seen = self.zeros
+        if seen >= rank:
+            return 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(max(round(1.1 ** bucket, 3), self.minimum), self.maximum)
+        return self.maximum
+
+    def export(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "min": self.minimum,
+            "max": self.maximum,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "zeros": self.zeros,
+            "buckets": self.buckets
+        }
+
+#
+# Whether an attribute holds a time in ms that may be rounded to an integer.
+#
+# @param key The name of the attribute.
+#
+def isTimingAttribute(key):
+    if key.endswith('Delta'):
+        key = key[:-5]
+    return key in timing_attributes or key.endswith('Runtime') or key == 'runtime'
+
+#
+# Encode attributes as compact JSON without whitespace.
+#
+# @param attributes The attributes returned by Inspector.finish.
+# @param integerTimings Whether to round ms timings to integers.
+# @param compress Whether to wrap the JSON in a zlib compressed, base64 encoded
+#                 envelope: {"saafEncoding": "zlib+base64", "data": "..."}.
+# @return The encoded attributes as a string.
+#
+def encodeAttributes(attributes, integerTimings = True, compress = False):
+    if integerTimings:
+        attributes = {key: int(round(value)) if isinstance(value, float) and isTimingAttribute(key) else value
+                      for key, value in attributes.items()}
+    encoded = json.dumps(attributes, separators=(',', ':'))
+    if compress:
+        data = base64.b64encode(zlib.compress(encoded.encode('utf-8'), 9)).decode('ascii')
+        encoded = json.dumps({"saafEncoding": "zlib+base64", "data": data}, separators=(',', ':'))
+    return encoded
+
+#
+# Decode attributes created by encodeAttributes.
+#
+# @param payload The encoded string or an already parsed dictionary.
+# @return The attributes as a dictionary.
+#
+def decodeAttributes(payload):
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    if payload.get('saafEncoding', None) == "zlib+base64":
+        payload = json.loads(zlib.decompress(base64.b64decode(payload['data'])).decode('utf-8'))
+    return payload
+
+#
+# Get a stable digest of a cpuinfo list such as flags, bugs or Features.
+#
+# @param values The list of values.
+# @return A 16 character hex digest.
+#
+def digestCPUFlags(values):
+    return hashlib.sha1(' '.join(values).encode('utf-8')).hexdigest()[:16]
+
+#
+# Expand a compact cpuInfo attribute back into one dictionary per core.
+#
+# @param cpuInfo The compact cpuInfo attribute with base and diff keys.
+# @param flagsTable The cpuFlagsTable attribute mapping digests to lists.
+# @return The cpuInfo list as it is returned when compactCPUInfo is disabled.
+#
+def expandCPUInfo(cpuInfo, flagsTable):
+    cores = []
+    for diff in [{}] + cpuInfo['diff']:
+        core = dict(cpuInfo['base'])
+        core.update(diff)
+        for key in ["flags", "bugs", "Features"]:
+            if key in core and core[key] in flagsTable:
+                core[key] = flagsTable[core[key]]
+        cores.append(core)
+    return cores
+
 #
 # Global variables that will persist through multiple invocations.
 #
 invocations = 0
 initialization_time = int(round(time.time() * 1000))
-ticks_per_second = int(runCommand("getconf CLK_TCK"))
+ticks_per_second = os.sysconf('SC_CLK_TCK')
+
+#
+# Attributes that cannot change within a container (CPU info, kernel, platform
+# and container identity). Filled on the first invocation of a container and
+# copied into the attributes of warm invocations.
+#
+static_cache = {}
+
+#
+# Persistent ProcFiles by path. See readProcFile.
+#
+proc_files = {}
+
+#
+# /proc files the kernel generates with single_open, which return their whole
+# content in one read.
+#
+single_read_files = ['/proc/stat', '/proc/meminfo', '/proc/self/status', '/proc/self/io', '/proc/self/stat']
+
+#
+# The CPU times of each cpu line of /proc/stat, the counters of /proc/stat and the
+# memory statistics read by readCPUStats and readMemoryStats.
+#
+cpu_metrics = ["cpuUser", "cpuNice", "cpuKernel", "cpuIdle", "cpuIOWait", "cpuIrq", "cpuSoftIrq", "cpuSteal",
+               "cpuGuest", "cpuGuestNice"]
+stat_counters = re.compile(rb'^(intr|ctxt|btime|processes|procs_running|procs_blocked|softirq) (\d+)', re.MULTILINE)
+memory_labels = [b'MemTotal:', b'\nMemFree:', b'\nMemAvailable:', b'\nBuffers:', b'\nCached:', b'\nSwapTotal:',
+                 b'\nSwapFree:']
+status_labels = [b'\nVmRSS:', b'\nVmHWM:']
+
+#
+# cgroup files of this container. See findCGroupFiles.
+#
+cgroup_files = None
+
+#
+# Traced memory when allocation tracing started in this container, and the
+# snapshot taken at the end of the previous invocation. See inspectAllocations.
+#
+allocation_baseline = None
+allocation_snapshot = None
+
+#
+# Cumulative and self import time in ns by module, the total time of top level
+# imports and the original import function while traceImports is active.
+#
+import_times = {}
+import_total = 0
+import_original = None
+
+#
+# Result of the host speed calibration of this container. See inspectHostSpeed.
+#
+host_speed = None
+
+#
+# Counters of the Inspector recording garbage collections with recordGC. Only one
+# Inspector records at a time, so an Inspector that is never finished does not
+# keep a callback registered or stay referenced after the next inspectGC.
+#
+gc_counters = None
+
+#
+# Whether the CPU frequency can be read in this container, e.g. arm64 hosts without
+# cpufreq have none. None until the first inspectCPUFrequency.
+#
+cpu_frequency_available = None
+
+#
+# Histograms of each aggregated metric for the invocations since the last summary
+# was returned, and the time in ms the window started. See summaryEvery.
+#
+aggregates = {}
+aggregate_count = 0
+aggregate_start = int(round(time.time() * 1000))
+
+#
+# Metrics kept in the rolling aggregates and the fields kept in each invocation's
+# output when aggregation is enabled.
+#
+aggregate_metrics = ["runtime", "cpuUserDelta", "cpuKernelDelta", "pageFaultsDelta", "gcPauseTime"]
+aggregate_fields = ["version", "lang", "uuid", "newcontainer", "invocations", "startTime", "endTime", "runtime",
+                    "sampled", "sampleRate"]
+
+#
+# Attributes kept by each attribute profile. The minimal profile keeps timings and
+# identity, the standard profile drops large static and per device attributes and
+# the full profile keeps everything. Custom attributes and errors are always kept.
+#
+minimal_attributes = ["version", "lang", "startTime", "endTime", "runtime", "frameworkRuntime", "userRuntime",
+                      "frameworkRuntimeDeltas", "invocations", "initializationTime", "uuid", "newcontainer",
+                      "platform", "functionName", "functionMemory", "functionRegion", "containerID", "vmID",
+                      "cpuType", "cpuModel", "sampled", "sampleRate", "summary", "summaryInvocations", "summaryWindow"]
+standard_excluded_attributes = ["cpuInfo", "cpuFlagsTable", "linuxVersion", "cpuCaches", "cpuThreadSiblings",
+                                "cpuCoreSiblings", "cpuFrequencies", "cpuFrequenciesEnd", "networkInterfaceDeltas",
+                                "diskDeviceDeltas", "threadDeltas"]
+
+#
+# Attributes in ms that encodeAttributes may round. Delta versions are included.
+#
+timing_attributes = ["cpuUser", "cpuNice", "cpuKernel", "cpuIdle", "cpuIOWait", "cpuIrq", "cpuSoftIrq", "cpuSteal",
+                     "cpuGuest", "cpuGuestNice", "selfUser", "selfKernel", "childrenUser", "childrenKernel",
+                     "threadUser", "threadKernel"]
+
+#
+# Attribute names of the /proc/self/io counters and /proc/diskstats columns.
+#
+io_fields = {"rchar": "ioReadChars", "wchar": "ioWriteChars", "read_bytes": "ioReadBytes",
+             "write_bytes": "ioWriteBytes", "syscr": "ioReadSyscalls", "syscw": "ioWriteSyscalls"}
+rusage_fields = {"ru_utime": "UserDelta", "ru_stime": "KernelDelta", "ru_nvcsw": "VoluntaryContextSwitchesDelta",
+                 "ru_nivcsw": "InvoluntaryContextSwitchesDelta", "ru_inblock": "BlockInputsDelta", "ru_oublock": "BlockOutputsDelta"}
+disk_fields = {3: "diskReads", 5: "diskSectorsRead", 6: "diskReadTime", 7: "diskWrites",
+               9: "diskSectorsWritten", 10: "diskWriteTime", 12: "diskIOTime"}
+
+#
+# Values recorded by each sample of the background sampler. CPU times are in ms,
+# memory values in kB and time is the ms since the Inspector was initialized.
+#
+sampler_fields = ["time", "cpuUser", "cpuKernel", "cpuIdle", "cpuIOWait", "cpuSteal", "freeMemory", "availableMemory", "rss"]
 
 #
 # SAAF
@@ -37,13 +714,44 @@ class Inspector:
     #
     # __attributes: Used to store information collected by each function.
     # __startTime:  The time the function started running.
+    # __useShell:   Whether to collect data with shell commands instead of direct
+    #               syscalls and file reads. Both produce the same attributes.
+    # __useCache:   Whether warm invocations reuse static attributes collected
+    #               by the first invocation of the container.
+    # __compactCPUInfo: Whether cpuInfo stores one core and per core differences
+    #               with flag lists replaced by digests.
+    # __collectIO:  Whether inspectAll and inspectAllDeltas include inspectIO and
+    #               inspectIODelta.
+    # __freezeGC:   Whether finish() moves every object that survived the first
+    #               invocation of the container into the permanent generation.
+    # __sampled:    Whether this invocation is inspected. Set with sampleEvery (inspect
+    #               1 in N invocations) or sampleRate (probability of inspecting an
+    #               invocation). The first invocation of a container is always inspected.
+    # __summaryEvery / __summaryInterval: When either is set, finish() adds this
+    #               invocation to rolling container aggregates, returns only a few fields
+    #               and adds a summary every N invocations or T seconds.
+    # __attributeProfile: The attributes returned by finish(): "minimal", "standard" or "full".
+    # __includeAttributes / __excludeAttributes: Attributes to add to or remove from the profile.
     #
-    def __init__(self):
+    def __init__(self, useShell = False, useCache = True, compactCPUInfo = False, collectIO = False, freezeGC = False,
+                 sampleEvery = None, sampleRate = None, summaryEvery = None, summaryInterval = None,
+                 attributeProfile = "full", includeAttributes = None, excludeAttributes = None):
         global invocations
         global initialization_time
         invocations += 1
         
         self.__startTime = int(round(time.time() * 1000))
+        self.__useShell = useShell
+        self.__useCache = useCache
+        self.__compactCPUInfo = compactCPUInfo
+        self.__collectIO = collectIO
+        self.__freezeGC = freezeGC
+        self.__summaryEvery = summaryEvery
+        self.__summaryInterval = summaryInterval
+        self.__attributeProfile = attributeProfile
+        self.__includeAttributes = includeAttributes or []
+        self.__excludeAttributes = excludeAttributes or []
+        self.__customAttributes = set()
         self.__attributes = {
             "version": 0.7, 
             "lang": "python", 
@@ -52,14 +760,50 @@ class Inspector:
             "initializationTime": initialization_time
         }
 
+        self.__sampled = True
+        if (sampleEvery != None or sampleRate != None):
+            rate = 1 / sampleEvery if sampleEvery != None else sampleRate
+            if (invocations == 1):
+                rate = 1
+            elif (sampleEvery != None):
+                self.__sampled = invocations % sampleEvery == 0
+            else:
+                self.__sampled = random.random() < sampleRate
+            self.__attributes['sampled'] = 1 if self.__sampled else 0
+            self.__attributes['sampleRate'] = rate
+
+        self.__sampler = None
+        self.__profiler = None
+
+        self.__spanRoot = SpanNode()
+        self.__spanNodes = [self.__spanRoot]
+        self.__spanStarts = []
+        self.__spans = {}
+
         self.__cpuPolls = []
         self.__memoryPolls = []
         self.__networkPolls = []
 
         self.__inspectedCPU = False
         self.__inspectedCPUDelta = False
+        self.__inspectedCPUFrequency = False
+        self.__inspectedCPUFrequencyDelta = False
         self.__inspectedMemory = False
         self.__inspectedMemoryDelta = False
+        self.__inspectedNetwork = False
+        self.__inspectedNetworkDelta = False
+        self.__inspectedIO = False
+        self.__inspectedIODelta = False
+        self.__inspectedThreads = False
+        self.__inspectedThreadsDelta = False
+        self.__inspectedResources = False
+        self.__inspectedResourcesDelta = False
+        self.__inspectedCGroup = False
+        self.__inspectedCGroupDelta = False
+        self.__inspectedAllocations = False
+        self.__inspectedAllocationsDelta = False
+        self.__inspectedGC = False
+        self.__inspectedGCDelta = False
         self.__inspectedContainer = False
         self.__inspectedContainerDelta = False
         self.__inspectedPlatform = False
@@ -74,8 +818,15 @@ class Inspector:
     # newcontainer:    Whether a container is new (no assigned uuid) or if it has been used before.
     #
     def inspectContainer(self):
+        global static_cache
         self.__inspectedContainer = True
 
+        # The container id file is only checked for existence on warm invocations.
+        if (self.__useCache and 'container' in static_cache and os.path.isfile('/tmp/container-id')):
+            self.__attributes['uuid'] = static_cache['container']['uuid']
+            self.__attributes['newcontainer'] = 0
+            return
+
         myUuid = ''
         newContainer = 1
         if os.path.isfile('/tmp/container-id'):
@@ -92,6 +843,11 @@ class Inspector:
             
         self.__attributes['uuid'] = myUuid
         self.__attributes['newcontainer'] = newContainer
+
+        # A new container invalidates every cached static attribute.
+        if (newContainer == 1):
+            static_cache.clear()
+        static_cache['container'] = {'uuid': myUuid}
         
         
     #
@@ -101,8 +857,15 @@ class Inspector:
     # cpuModel:    The model number of the CPU.
     # cpuCores:     The number of vCPUs allocated to the function.
     # cpuInfo:    Detailed information about all aspects of the CPU.
+    # cpuFlagsTable: Flag lists by digest, only returned when compactCPUInfo is enabled
+    #             and the CPU info is collected instead of read from the cache.
     #
     def inspectCPUInfo(self):
+        cacheName = 'compactCPUInfo' if self.__compactCPUInfo else 'cpuInfo'
+        if (self.__loadCache(cacheName)):
+            return
+        before = dict(self.__attributes)
+
         with open('/proc/cpuinfo', 'r') as file:
             cpuInfo = file.read()
         lines = cpuInfo.split('\n')
@@ -141,41 +904,147 @@ class Inspector:
                 self.__attributes['cpuModel'] = core_list[list_len]['Model']
             self.__attributes['architecture'] = "arm64"
         self.__attributes['cpuCores'] = int(cpu_count)
-        self.__attributes['cpuInfo'] = core_list
+        if (self.__compactCPUInfo):
+            flagsTable = {}
+            compact_list = []
+            for core in core_list:
+                compact_core = dict(core)
+                for key in ["flags", "bugs", "Features"]:
+                    if key in core:
+                        digest = digestCPUFlags(core[key])
+                        flagsTable[digest] = core[key]
+                        compact_core[key] = digest
+                compact_list.append(compact_core)
+
+            base = compact_list[0]
+            self.__attributes['cpuInfo'] = {
+                "base": base,
+                "diff": [{key: value for key, value in core.items() if base.get(key) != value} for core in compact_list[1:]]
+            }
+        else:
+            self.__attributes['cpuInfo'] = core_list
+        self.__saveCache(cacheName, before)
+
+        # The flag lists are only needed once per container to resolve the digests.
+        if (self.__compactCPUInfo):
+            self.__attributes['cpuFlagsTable'] = flagsTable
         
+    #
+    # Collect the CPU topology from /sys/devices/system/cpu and /sys/devices/system/node.
+    #
+    # cpuOnline:          The list of online CPUs, e.g. "0-5".
+    # cpuCaches:          Each distinct cache as [level, type, size, shared CPU list].
+    # cpuThreadSiblings:  Each distinct group of hardware threads that share a core.
+    # cpuCoreSiblings:    Each distinct group of CPUs that share a physical package.
+    # numaNodes:          The list of online NUMA nodes, e.g. "0".
+    #
+    def inspectCPUTopology(self):
+        if (self.__loadCache('cpuTopology')):
+            return
+        before = dict(self.__attributes)
+
+        root = '/sys/devices/system/cpu/'
+        if not os.path.isdir(root):
+            self.__attributes['SAAFCPUTopologyError'] = "/sys/devices/system/cpu does not exist!"
+            return
+        self.__attributes['cpuOnline'] = readFile(root + 'online').strip()
+
+        caches = []
+        threadSiblings = []
+        coreSiblings = []
+        for cpu in sorted(os.listdir(root)):
+            if not (cpu.startswith('cpu') and cpu[3:].isdigit()):
+                continue
+            cacheRoot = root + cpu + '/cache/'
+            if os.path.isdir(cacheRoot):
+                for index in sorted(os.listdir(cacheRoot)):
+                    if not index.startswith('index'):
+                        continue
+                    directory = cacheRoot + index + '/'
+                    cache = [readFile(directory + name).strip() for name in ['level', 'type', 'size', 'shared_cpu_list']]
+                    if cache[0].isdigit():
+                        cache[0] = int(cache[0])
+                    if cache not in caches:
+                        caches.append(cache)
+            for name, groups in [('thread_siblings_list', threadSiblings), ('core_siblings_list', coreSiblings)]:
+                group = readFile(root + cpu + '/topology/' + name).strip()
+                if group != '' and group not in groups:
+                    groups.append(group)
+
+        self.__attributes['cpuCaches'] = caches
+        self.__attributes['cpuThreadSiblings'] = threadSiblings
+        self.__attributes['cpuCoreSiblings'] = coreSiblings
+        self.__attributes['numaNodes'] = readFile('/sys/devices/system/node/online').strip()
+        self.__saveCache('cpuTopology', before)
+
+    #
+    # Read the current frequency of every CPU in MHz from cpufreq, or from the
+    # cpu MHz lines of /proc/cpuinfo when cpufreq is not available.
+    #
+    # @return A list of frequencies, one per CPU.
+    #
+    def __readCPUFrequencies(self):
+        root = '/sys/devices/system/cpu/'
+        frequencies = []
+        if os.path.isdir(root + 'cpufreq'):
+            cpus = [cpu for cpu in os.listdir(root) if cpu.startswith('cpu') and cpu[3:].isdigit()]
+            for cpu in sorted(cpus, key=lambda cpu: int(cpu[3:])):
+                frequency = readFile(root + cpu + '/cpufreq/scaling_cur_freq').strip()
+                if frequency.isdigit():
+                    frequencies.append(round(int(frequency) / 1000, 3))
+        if len(frequencies) == 0:
+            for line in readFile('/proc/cpuinfo').split('\n'):
+                if line.startswith('cpu MHz'):
+                    frequencies.append(float(line.split(':')[1]))
+        return frequencies
+
+    #
+    # Sample the frequency of each CPU.
+    #
+    # cpuFrequency:     The average CPU frequency in MHz.
+    # cpuFrequencies:   The frequency of each CPU in MHz.
+    #
+    # @param reportMissing Whether to add an error when the frequency is not available.
+    #
+    def inspectCPUFrequency(self, reportMissing = True):
+        global cpu_frequency_available
+        frequencies = self.__readCPUFrequencies()
+        cpu_frequency_available = len(frequencies) > 0
+        if len(frequencies) == 0:
+            if (reportMissing):
+                self.__attributes['SAAFCPUFrequencyError'] = "CPU frequency is not available!"
+            return
+        self.__inspectedCPUFrequency = True
+        self.__attributes['cpuFrequency'] = round(sum(frequencies) / len(frequencies), 3)
+        self.__attributes['cpuFrequencies'] = frequencies
+
+    #
+    # Sample the frequency of each CPU again to see how it changed since inspectCPUFrequency.
+    #
+    # cpuFrequencyEnd:     The average CPU frequency in MHz.
+    # cpuFrequenciesEnd:   The frequency of each CPU in MHz.
+    # cpuFrequencyDelta:   Change in the average CPU frequency in MHz.
+    #
+    def inspectCPUFrequencyDelta(self):
+        if (self.__inspectedCPUFrequency):
+            self.__inspectedCPUFrequencyDelta = True
+            frequencies = self.__readCPUFrequencies()
+            if len(frequencies) == 0:
+                return
+            average = round(sum(frequencies) / len(frequencies), 3)
+            self.__attributes['cpuFrequencyEnd'] = average
+            self.__attributes['cpuFrequenciesEnd'] = frequencies
+            self.__attributes['cpuFrequencyDelta'] = round(average - self.__attributes['cpuFrequency'], 3)
+        else:
+            self.__attributes['SAAFCPUFrequencyDeltaError'] = "CPU frequency not inspected before collecting deltas!"
+
     #
     # Collect timing CPU metrics
     #
     def pollCPUStats(self):
-        global ticks_per_second
-        
         timeStamp = int(round(time.time() * 1000))
-
-        cpuValues = ["cpuUser", "cpuNice", "cpuKernel", "cpuIdle", "cpuIOWait", "cpuIrq", "cpuSoftIrq", "cpuSteal", "cpuGuest", "cpuGuestNice"]
         data = {"time": timeStamp}
-        
-        tick_rate = 1000 / ticks_per_second
-
-        with open('/proc/stat', 'r') as file:
-            stats = file.read()
-        lines = stats.split('\n')
-        lines[0] = lines[0].replace("cpu  ", "cpuTotal ")
-        
-        for line in lines:
-            values = line.split(" ")
-            title = values[0].strip()
-            
-            if ("cpu" in title):
-                index = 1
-                stats = {}
-                for value in cpuValues:
-                    stats[value] = int(values[index]) * (tick_rate)
-                    index += 1
-                data[title] = stats
-            else:
-                if len(values) >= 2:
-                    data[title] = int(values[1])
-                    
+        data.update(readCPUStats())
         self.__cpuPolls.append(data)
         
         
@@ -240,6 +1109,185 @@ class Inspector:
     def processCPUPolls(self):
         self.__attributes['cpuPolls'] = self.__cpuPolls
 
+    #
+    # Start a background thread that samples /proc/stat, /proc/meminfo and the
+    # RSS of this process into a preallocated ring buffer. The sampler is stopped
+    # by finish(), or stopSampler(), which adds the time series to the output.
+    #
+    # @param interval The time between samples in ms.
+    # @param size The number of samples to keep. Older samples are overwritten.
+    #
+    def startSampler(self, interval = 50, size = 1200):
+        if (self.__sampler != None):
+            return
+        self.__samplerInterval = interval
+        self.__samplerSize = size
+        self.__samplerCount = 0
+        self.__samplerBuffer = array.array('q', [0]) * (size * len(sampler_fields))
+        self.__samplerStop = threading.Event()
+        self.__sampler = threading.Thread(target=self.__runSampler, daemon=True)
+        self.__sampler.start()
+
+    #
+    # Body of the sampler thread. Values are written directly into the ring buffer
+    # so no objects are kept per sample. The sampler uses its own ProcFiles so it
+    # never shares a buffer with the main thread.
+    #
+    def __runSampler(self):
+        global ticks_per_second
+        tick_rate = 1000 / ticks_per_second
+        page_size = os.sysconf('SC_PAGE_SIZE') // 1024
+        width = len(sampler_fields)
+        buffer = self.__samplerBuffer
+        stat = ProcFile('/proc/stat')
+        memInfo = ProcFile('/proc/meminfo')
+
+        while True:
+            index = (self.__samplerCount % self.__samplerSize) * width
+            buffer[index] = int(round(time.time() * 1000)) - self.__startTime
+
+            stat.read()
+            cpu = stat.firstLine()
+            buffer[index + 1] = int(int(cpu[1]) * tick_rate)
+            buffer[index + 2] = int(int(cpu[3]) * tick_rate)
+            buffer[index + 3] = int(int(cpu[4]) * tick_rate)
+            buffer[index + 4] = int(int(cpu[5]) * tick_rate)
+            buffer[index + 5] = int(int(cpu[8]) * tick_rate)
+
+            memInfo.read()
+            buffer[index + 6] = memInfo.value(b'MemFree:')
+            buffer[index + 7] = memInfo.value(b'MemAvailable:') or 0
+
+            with open('/proc/self/statm', 'rb') as file:
+                buffer[index + 8] = int(file.read().split()[1]) * page_size
+
+            self.__samplerCount += 1
+            if self.__samplerStop.wait(self.__samplerInterval / 1000):
+                break
+
+        stat.close()
+        memInfo.close()
+
+    #
+    # Stop the background sampler and add the samples as a time series.
+    #
+    # samplerInterval:  The time between samples in ms.
+    # samplerSamples:   The total number of samples taken, including overwritten samples.
+    # samplerSeries:    One list per value in sampler_fields, oldest sample first.
+    #
+    def stopSampler(self):
+        if (self.__sampler == None):
+            return
+        self.__samplerStop.set()
+        self.__sampler.join()
+        self.__sampler = None
+
+        width = len(sampler_fields)
+        count = min(self.__samplerCount, self.__samplerSize)
+        series = {}
+        for field in range(width):
+            series[sampler_fields[field]] = [self.__samplerBuffer[(sample % self.__samplerSize) * width + field]
+                                             for sample in range(self.__samplerCount - count, self.__samplerCount)]
+
+        self.__attributes['samplerInterval'] = self.__samplerInterval
+        self.__attributes['samplerSamples'] = self.__samplerCount
+        self.__attributes['samplerSeries'] = series
+
+    #
+    # Collect memory metrics from /proc/meminfo and the resident set size of this
+    # process from /proc/self/status. All values are in kB. See memory_labels and
+    # status_labels for the values collected.
+    #
+    def pollMemoryStats(self):
+        timeStamp = int(round(time.time() * 1000))
+        data = {"time": timeStamp}
+        data.update(readMemoryStats())
+        self.__memoryPolls.append(data)
+
+    #
+    # Start a statistical profiler. A background thread samples the stack of every
+    # other thread with sys._current_frames() every interval ms. finish() stops the
+    # profiler and adds the most common stacks in collapsed stack format, ready to
+    # be rendered as a flame graph.
+    #
+    # @param interval The time between samples in ms.
+    # @param top The number of most common stacks to return.
+    #
+    def inspectProfile(self, interval = 10, top = 100):
+        if (self.__profiler != None):
+            return
+        self.__profileInterval = interval
+        self.__profileTop = top
+        self.__profileStacks = {}
+        self.__profileSamples = 0
+        self.__profileTime = 0
+        self.__profileStop = threading.Event()
+        self.__profiler = threading.Thread(target=self.__runProfiler, daemon=True)
+        self.__profiler.start()
+
+    #
+    # Body of the profiler thread. Stacks are counted by their code objects and
+    # only converted to strings when the profiler stops.
+    #
+    def __runProfiler(self):
+        ownIdent = threading.get_ident()
+        stacks = self.__profileStacks
+
+        while not self.__profileStop.wait(self.__profileInterval / 1000):
+            startTime = time.perf_counter()
+            # stopSampler may clear __sampler while the profiler runs, so read it once.
+            sampler = self.__sampler
+            samplerIdent = sampler.ident if sampler != None else None
+            for ident, frame in sys._current_frames().items():
+                if ident == ownIdent or ident == samplerIdent:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                key = tuple(stack)
+                stacks[key] = stacks.get(key, 0) + 1
+            self.__profileSamples += 1
+            self.__profileTime += time.perf_counter() - startTime
+
+    #
+    # Stop the profiler and add the collected stacks to the output.
+    #
+    # profile:          The top stacks in collapsed format ("outer;...;inner") with sample counts.
+    # profileSamples:   The number of times the threads were sampled.
+    # profileInterval:  The time between samples in ms.
+    # profileOverhead:  The time in ms the profiler spent sampling stacks.
+    #
+    def stopProfile(self):
+        if (self.__profiler == None):
+            return
+        self.__profileStop.set()
+        self.__profiler.join()
+        self.__profiler = None
+
+        labels = {}
+        def label(code):
+            if code not in labels:
+                labels[code] = code.co_name + " (" + os.path.basename(code.co_filename) + ":" + str(code.co_firstlineno) + ")"
+            return labels[code]
+
+        profile = {}
+        for stack, count in self.__profileStacks.items():
+            collapsed = ";".join([label(code) for code in reversed(stack)])
+            profile[collapsed] = profile.get(collapsed, 0) + count
+        topStacks = sorted(profile.items(), key=lambda item: item[1], reverse=True)[:self.__profileTop]
+
+        self.__attributes['profile'] = dict(topStacks)
+        self.__attributes['profileSamples'] = self.__profileSamples
+        self.__attributes['profileInterval'] = self.__profileInterval
+        self.__attributes['profileOverhead'] = round(self.__profileTime * 1000, 2)
+
+    #
+    # Make memory polls accessible to the function.
+    #
+    def processMemoryPolls(self):
+        self.__attributes['memoryPolls'] = self.__memoryPolls
+
     #
     # Inspects /proc/meminfo and /proc/vmstat. Add memory specific attributes:
     # 
@@ -247,26 +1295,24 @@ class Inspector:
     # freeMemory:      Current free memory in kB when inspectMemory is called.
     # pageFaults:      Total number of page faults experienced by the vm since boot.
     # majorPageFaults: Total number of major page faults experienced since boot.
+    # residentMemory:  Resident set size of this process in kB (VmRSS).
+    # peakResidentMemory: Peak resident set size of this process in kB (VmHWM).
     #
     def inspectMemory(self):
         self.__inspectedMemory = True
-        memInfo = ""
-        with open('/proc/meminfo', 'r') as file:
-            memInfo = file.read()
-        lines = memInfo.split('\n')
-        self.__attributes['totalMemory'] = int(lines[0].replace("MemTotal:", "").replace(" kB", "").strip())
-        self.__attributes['freeMemory'] = int(lines[1].replace("MemFree:", "").replace(" kB", "").strip())
+
+        self.pollMemoryStats()
+        poll = self.__memoryPolls[-1]
+        self.__attributes['totalMemory'] = poll['MemTotal']
+        self.__attributes['freeMemory'] = poll['MemFree']
+        if 'VmRSS' in poll:
+            self.__attributes['residentMemory'] = poll['VmRSS']
+            self.__attributes['peakResidentMemory'] = poll['VmHWM']
 
         if os.path.isfile('/proc/vmstat'):
-            vmStat = ""
-            with open('/proc/vmstat', 'r') as file:
-                vmStat = file.read()
-            lines = vmStat.split("\n")
-            for line in lines:
-                if 'pgfault' in line:
-                    self.__attributes['pageFaults'] = int(line.split(' ')[1])
-                elif 'mgmajfault' in line:
-                    self.__attributes['majorPageFaults'] = int(line.split(' ')[1])
+            vmStat = readProcFile('/proc/vmstat')
+            self.__attributes['pageFaults'] = vmStat.value(b'\npgfault ')
+            self.__attributes['majorPageFaults'] = vmStat.value(b'\npgmajfault ')
         else:
             self.__attributes['SAAFMemoryError'] = "/proc/vmstat does not exist!"
 
@@ -275,25 +1321,636 @@ class Inspector:
     # 
     # pageFaultsDelta:     The number of page faults experienced since inspectMemory was called.
     # majorPageFaultsDelta: The number of major pafe faults since inspectMemory was called.
+    # residentMemoryDelta: Change in the resident set size of this process in kB.
+    # peakResidentMemoryDelta: Change in the peak resident set size of this process in kB.
     #
     def inspectMemoryDelta(self):
         if (self.__inspectedMemory):
             self.__inspectedMemoryDelta = True
+
+            self.pollMemoryStats()
+            poll = self.__memoryPolls[-1]
+            if 'residentMemory' in self.__attributes and 'VmRSS' in poll:
+                self.__attributes['residentMemoryDelta'] = poll['VmRSS'] - self.__attributes['residentMemory']
+                self.__attributes['peakResidentMemoryDelta'] = poll['VmHWM'] - self.__attributes['peakResidentMemory']
+
             if os.path.isfile('/proc/vmstat'):
-                vmStat = ""
-                with open('/proc/vmstat', 'r') as file:
-                    vmStat = file.read()
-                lines = vmStat.split("\n")
-                for line in lines:
-                    if 'pgfault' in line:
-                        self.__attributes['pageFaultsDelta'] = int(line.split(' ')[1]) - self.__attributes['pageFaults']
-                    elif 'mgmajfault' in line:
-                        self.__attributes['majorPageFaultsDelta'] = int(line.split(' ')[1]) - self.__attributes['majorPageFaults']
+                vmStat = readProcFile('/proc/vmstat')
+                self.__attributes['pageFaultsDelta'] = vmStat.value(b'\npgfault ') - self.__attributes['pageFaults']
+                self.__attributes['majorPageFaultsDelta'] = vmStat.value(b'\npgmajfault ') - self.__attributes['majorPageFaults']
             else:
                 self.__attributes['SAAFMemoryDeltaError'] = "/proc/vmstat does not exist!"
         else:
             self.__attributes['SAAFMemoryDeltaError'] = "Memory not inspected before collecting deltas!"
-        
+
+    #
+    # Collect per interface network metrics from /proc/net/dev.
+    #
+    def pollNetworkStats(self):
+        timeStamp = int(round(time.time() * 1000))
+        data = {"time": timeStamp}
+
+        with open('/proc/net/dev', 'r') as file:
+            netDev = file.read()
+
+        # The first two lines are column headers.
+        for line in netDev.split('\n')[2:]:
+            if ':' not in line:
+                continue
+            interface, counters = line.split(':', 1)
+            values = counters.split()
+            data[interface.strip()] = {
+                "rxBytes": int(values[0]),
+                "rxPackets": int(values[1]),
+                "rxDrop": int(values[3]),
+                "txBytes": int(values[8]),
+                "txPackets": int(values[9]),
+                "txDrop": int(values[11])
+            }
+
+        self.__networkPolls.append(data)
+
+    #
+    # Make network polls accessible to the function.
+    #
+    def processNetworkPolls(self):
+        self.__attributes['networkPolls'] = self.__networkPolls
+
+    #
+    # Inspects /proc/net/dev. Totals exclude the loopback interface.
+    #
+    # networkRxBytes:     Total bytes received by the VM since boot.
+    # networkRxPackets:   Total packets received by the VM since boot.
+    # networkRxDrop:      Total received packets dropped since boot.
+    # networkTxBytes:     Total bytes transmitted by the VM since boot.
+    # networkTxPackets:   Total packets transmitted by the VM since boot.
+    # networkTxDrop:      Total transmitted packets dropped since boot.
+    #
+    def inspectNetwork(self):
+        if not os.path.isfile('/proc/net/dev'):
+            self.__attributes['SAAFNetworkError'] = "/proc/net/dev does not exist!"
+            return
+        self.__inspectedNetwork = True
+
+        self.pollNetworkStats()
+        totals = self.__sumNetworkPoll(self.__networkPolls[0])
+        for metric in totals:
+            self.__attributes['network' + metric[0].upper() + metric[1:]] = totals[metric]
+
+    #
+    # Compare information gained from inspectNetwork to the current network metrics.
+    #
+    # networkRxBytesDelta:     Bytes received since inspectNetwork was called.
+    # networkRxPacketsDelta:   Packets received since inspectNetwork was called.
+    # networkRxDropDelta:      Received packets dropped since inspectNetwork was called.
+    # networkTxBytesDelta:     Bytes transmitted since inspectNetwork was called.
+    # networkTxPacketsDelta:   Packets transmitted since inspectNetwork was called.
+    # networkTxDropDelta:      Transmitted packets dropped since inspectNetwork was called.
+    # networkInterfaceDeltas:  The same deltas for each interface, including loopback.
+    #
+    def inspectNetworkDelta(self):
+        if (self.__inspectedNetwork):
+            self.__inspectedNetworkDelta = True
+
+            self.pollNetworkStats()
+            first = self.__networkPolls[0]
+            last = self.__networkPolls[len(self.__networkPolls) - 1]
+
+            firstTotals = self.__sumNetworkPoll(first)
+            lastTotals = self.__sumNetworkPoll(last)
+            for metric in lastTotals:
+                self.__attributes['network' + metric[0].upper() + metric[1:] + 'Delta'] = lastTotals[metric] - firstTotals[metric]
+
+            interfaceDeltas = {}
+            for interface in last:
+                if interface == 'time' or interface not in first:
+                    continue
+                interfaceDeltas[interface] = {}
+                for metric in last[interface]:
+                    interfaceDeltas[interface][metric + 'Delta'] = last[interface][metric] - first[interface][metric]
+            self.__attributes['networkInterfaceDeltas'] = interfaceDeltas
+        else:
+            self.__attributes['SAAFNetworkDeltaError'] = "Network not inspected before collecting deltas!"
+
+    #
+    # Sum the metrics of every interface in a network poll except loopback.
+    #
+    # @param poll A network poll created by pollNetworkStats.
+    # @return A dictionary of metric totals.
+    #
+    def __sumNetworkPoll(self, poll):
+        totals = {"rxBytes": 0, "rxPackets": 0, "rxDrop": 0, "txBytes": 0, "txPackets": 0, "txDrop": 0}
+        for interface in poll:
+            if interface == 'time' or interface == 'lo':
+                continue
+            for metric in totals:
+                totals[metric] += poll[interface][metric]
+        return totals
+
+    #
+    # Read the I/O counters of this process and every whole disk, ignoring loop
+    # and ram devices and partitions.
+    #
+    # @return The process counters and a dictionary of counters per disk.
+    #
+    def __readIOStats(self):
+        processIO = {}
+        with open('/proc/self/io', 'r') as file:
+            ioStats = file.read()
+        for line in ioStats.split('\n'):
+            values = line.split(':')
+            if len(values) == 2 and values[0] in io_fields:
+                processIO[io_fields[values[0]]] = int(values[1])
+
+        disks = {}
+        if os.path.isfile('/proc/diskstats'):
+            for line in readProcFile('/proc/diskstats').text().split('\n'):
+                values = line.split()
+                if (len(values) < 14 or values[2].startswith('loop') or values[2].startswith('ram')
+                        or not os.path.isdir('/sys/block/' + values[2].replace('/', '!'))):
+                    continue
+                disks[values[2]] = {disk_fields[index]: int(values[index]) for index in disk_fields}
+        return processIO, disks
+
+    #
+    # Inspects /proc/self/io and /proc/diskstats. Disk values are summed over all disks.
+    #
+    # ioReadChars:       Bytes read by this process with read syscalls, including the page cache.
+    # ioWriteChars:      Bytes written by this process with write syscalls, including the page cache.
+    # ioReadBytes:       Bytes this process caused to be fetched from storage.
+    # ioWriteBytes:      Bytes this process caused to be sent to storage.
+    # ioReadSyscalls:    Number of read syscalls made by this process.
+    # ioWriteSyscalls:   Number of write syscalls made by this process.
+    # diskReads:         Reads completed by the disks since boot.
+    # diskSectorsRead:   Sectors read by the disks since boot.
+    # diskReadTime:      Time in ms spent reading since boot.
+    # diskWrites:        Writes completed by the disks since boot.
+    # diskSectorsWritten: Sectors written by the disks since boot.
+    # diskWriteTime:     Time in ms spent writing since boot.
+    # diskIOTime:        Time in ms the disks were busy since boot.
+    #
+    def inspectIO(self):
+        if not os.path.isfile('/proc/self/io'):
+            self.__attributes['SAAFIOError'] = "/proc/self/io does not exist!"
+            return
+        self.__inspectedIO = True
+
+        self.__ioStart = self.__readIOStats()
+        processIO, disks = self.__ioStart
+        self.__attributes.update(processIO)
+        for metric in disk_fields.values():
+            self.__attributes[metric] = sum([disks[disk][metric] for disk in disks])
+
+    #
+    # Compare information gained from inspectIO to the current I/O counters.
+    #
+    # ioReadCharsDelta, ioWriteCharsDelta, ioReadBytesDelta, ioWriteBytesDelta,
+    # ioReadSyscallsDelta, ioWriteSyscallsDelta, diskReadsDelta, diskSectorsReadDelta,
+    # diskReadTimeDelta, diskWritesDelta, diskSectorsWrittenDelta, diskWriteTimeDelta,
+    # diskIOTimeDelta: Change in each value since inspectIO was called.
+    # diskDeviceDeltas:  The disk deltas for each disk.
+    #
+    def inspectIODelta(self):
+        if (self.__inspectedIO):
+            self.__inspectedIODelta = True
+
+            processIO, disks = self.__readIOStats()
+            startIO, startDisks = self.__ioStart
+            for metric in processIO:
+                self.__attributes[metric + 'Delta'] = processIO[metric] - startIO[metric]
+
+            deviceDeltas = {}
+            for disk in disks:
+                if disk in startDisks:
+                    deviceDeltas[disk] = {metric + 'Delta': disks[disk][metric] - startDisks[disk][metric] for metric in disk_fields.values()}
+            for metric in disk_fields.values():
+                self.__attributes[metric + 'Delta'] = sum([deviceDeltas[disk][metric + 'Delta'] for disk in deviceDeltas])
+            self.__attributes['diskDeviceDeltas'] = deviceDeltas
+        else:
+            self.__attributes['SAAFIODeltaError'] = "IO not inspected before collecting deltas!"
+
+    #
+    # Read the user and kernel time of this process and each of its threads.
+    #
+    # @return The process times and a dictionary of times per thread id, all in ms.
+    #
+    def __readThreadStats(self):
+        global ticks_per_second
+        tick_rate = 1000 / ticks_per_second
+
+        # The thread name is in parentheses and may contain spaces, so fields are
+        # counted from the closing parenthesis. utime and stime are fields 14 and 15.
+        with open('/proc/self/stat', 'r') as file:
+            values = file.read().rsplit(')', 1)[1].split()
+        process = {"user": int(values[11]) * tick_rate, "kernel": int(values[12]) * tick_rate}
+
+        threads = {}
+        for tid in os.listdir('/proc/self/task'):
+            try:
+                with open('/proc/self/task/' + tid + '/stat', 'r') as file:
+                    values = file.read().rsplit(')', 1)[1].split()
+                threads[int(tid)] = {"user": int(values[11]) * tick_rate, "kernel": int(values[12]) * tick_rate}
+            except Exception:
+                # The thread exited while the tasks were being listed.
+                pass
+        return process, threads
+
+    #
+    # Inspects /proc/self/task to record the CPU time used by each thread of this process.
+    #
+    # threadCount:    The number of threads running in the function process.
+    #
+    def inspectThreads(self):
+        if not os.path.isdir('/proc/self/task'):
+            self.__attributes['SAAFThreadsError'] = "/proc/self/task does not exist!"
+            return
+        self.__inspectedThreads = True
+
+        self.__threadsStartTime = time.perf_counter()
+        self.__threadsStart = self.__readThreadStats()
+        self.__attributes['threadCount'] = len(self.__threadsStart[1])
+
+    #
+    # Compare the CPU time of each thread to when inspectThreads was called.
+    #
+    # threadDeltas:        For each thread id, the thread name and its user and kernel
+    #                      time in ms since inspectThreads was called.
+    # threadUserDelta:     User time in ms of the whole process, including exited threads.
+    # threadKernelDelta:   Kernel time in ms of the whole process, including exited threads.
+    # threadParallelism:   Busy thread seconds divided by wall clock seconds. A value
+    #                      of 2 means on average two threads were running at once.
+    #
+    def inspectThreadsDelta(self):
+        if (self.__inspectedThreads):
+            self.__inspectedThreadsDelta = True
+
+            process, threads = self.__readThreadStats()
+            wallTime = (time.perf_counter() - self.__threadsStartTime) * 1000
+            startProcess, startThreads = self.__threadsStart
+
+            # Thread.native_id needs Python 3.8, on older versions names are left unresolved.
+            names = {getattr(thread, 'native_id', None): thread.name for thread in threading.enumerate()}
+            names.pop(None, None)
+            deltas = {}
+            for tid in threads:
+                start = startThreads.get(tid, {"user": 0, "kernel": 0})
+                deltas[tid] = {
+                    "userDelta": threads[tid]["user"] - start["user"],
+                    "kernelDelta": threads[tid]["kernel"] - start["kernel"]
+                }
+                # Threads that are not Python threads or have exited have no name.
+                if tid in names:
+                    deltas[tid]["name"] = names[tid]
+
+            userDelta = process["user"] - startProcess["user"]
+            kernelDelta = process["kernel"] - startProcess["kernel"]
+            self.__attributes['threadDeltas'] = deltas
+            self.__attributes['threadUserDelta'] = userDelta
+            self.__attributes['threadKernelDelta'] = kernelDelta
+            if (wallTime > 0):
+                self.__attributes['threadParallelism'] = round((userDelta + kernelDelta) / wallTime, 3)
+        else:
+            self.__attributes['SAAFThreadsDeltaError'] = "Threads not inspected before collecting deltas!"
+
+    #
+    # Record the resource usage of this process and its terminated children with
+    # getrusage. No attributes are added until inspectResourcesDelta is called.
+    #
+    def inspectResources(self):
+        if (resource == None):
+            self.__attributes['SAAFResourcesError'] = "The resource module is not available!"
+            return
+        self.__inspectedResources = True
+        self.__resourcesStart = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+
+    #
+    # Compare resource usage to when inspectResources was called. Times are in ms.
+    # Child values only include children that have terminated and been waited for,
+    # such as commands run with subprocess.run.
+    #
+    # selfUserDelta / childrenUserDelta:         User time used.
+    # selfKernelDelta / childrenKernelDelta:     Kernel time used.
+    # selfMaxRSS / childrenMaxRSS:               Maximum resident set size in kB. For
+    #                                            children this is the largest child.
+    # selfVoluntaryContextSwitchesDelta / childrenVoluntaryContextSwitchesDelta:
+    #                                            Context switches while waiting for a resource.
+    # selfInvoluntaryContextSwitchesDelta / childrenInvoluntaryContextSwitchesDelta:
+    #                                            Context switches forced by the scheduler.
+    # selfBlockInputsDelta / childrenBlockInputsDelta:   Block input operations.
+    # selfBlockOutputsDelta / childrenBlockOutputsDelta: Block output operations.
+    #
+    def inspectResourcesDelta(self):
+        if (self.__inspectedResources):
+            self.__inspectedResourcesDelta = True
+
+            end = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+            for prefix, start, current in [("self", self.__resourcesStart[0], end[0]), ("children", self.__resourcesStart[1], end[1])]:
+                for field in rusage_fields:
+                    value = getattr(current, field) - getattr(start, field)
+                    if (field == "ru_utime" or field == "ru_stime"):
+                        value = round(value * 1000, 3)
+                    self.__attributes[prefix + rusage_fields[field]] = value
+                self.__attributes[prefix + "MaxRSS"] = current.ru_maxrss
+        else:
+            self.__attributes['SAAFResourcesDeltaError'] = "Resources not inspected before collecting deltas!"
+
+    #
+    # Read the cgroup CPU throttling counters, memory usage and pressure stall totals.
+    #
+    # @return A dictionary of the values that exist. Times are in microseconds.
+    #
+    def __readCGroupStats(self):
+        global cgroup_files
+        if (cgroup_files == None):
+            cgroup_files = findCGroupFiles()
+
+        stats = {}
+        if 'cpuStat' in cgroup_files:
+            cpuStat = {}
+            for line in readFile(cgroup_files['cpuStat']).split('\n'):
+                values = line.split()
+                if len(values) == 2:
+                    cpuStat[values[0]] = int(values[1])
+            if 'nr_periods' in cpuStat:
+                stats['cgroupPeriods'] = cpuStat['nr_periods']
+                stats['cgroupThrottledPeriods'] = cpuStat['nr_throttled']
+            if 'throttled_usec' in cpuStat:
+                stats['cgroupThrottledTime'] = cpuStat['throttled_usec']
+            elif 'throttled_time' in cpuStat:
+                stats['cgroupThrottledTime'] = cpuStat['throttled_time'] // 1000
+        if 'memoryCurrent' in cgroup_files:
+            stats['cgroupMemoryCurrent'] = int(readFile(cgroup_files['memoryCurrent']).strip())
+
+        for resource_name in ["cpu", "memory", "io"]:
+            for line in readFile('/proc/pressure/' + resource_name).split('\n'):
+                values = line.split()
+                if len(values) == 5 and values[4].startswith('total='):
+                    stats['pressure' + resource_name.upper()[0] + resource_name[1:] + values[0].capitalize()] = int(values[4][6:])
+        return stats
+
+    #
+    # Inspects the cgroup of this process and /proc/pressure when they exist.
+    #
+    # cgroupVersion:          The cgroup version of the CPU controller (1 or 2).
+    # cgroupCPULimit:         The CPU quota as a number of CPUs, left out if unlimited.
+    # cgroupMemoryMax:        The cgroup memory limit in bytes, left out if unlimited.
+    # cgroupMemoryCurrent:    The memory used by the cgroup in bytes.
+    # cgroupPeriods:          The number of CPU quota periods that have elapsed.
+    # cgroupThrottledPeriods: The number of periods the cgroup was throttled in.
+    # cgroupThrottledTime:    Total time in microseconds the cgroup was throttled.
+    # pressureCpuSome, pressureCpuFull, pressureMemorySome, pressureMemoryFull,
+    # pressureIoSome, pressureIoFull: Total time in microseconds that some or all
+    #                         tasks were stalled waiting for the resource.
+    #
+    def inspectCGroup(self):
+        global cgroup_files
+        self.__inspectedCGroup = True
+
+        self.__cgroupStart = self.__readCGroupStats()
+        self.__attributes.update(self.__cgroupStart)
+        if 'version' in cgroup_files:
+            self.__attributes['cgroupVersion'] = cgroup_files['version']
+
+        cpuLimit = None
+        if 'cpuMax' in cgroup_files:
+            values = readFile(cgroup_files['cpuMax']).split()
+            if len(values) == 2 and values[0] != 'max':
+                cpuLimit = int(values[0]) / int(values[1])
+        elif 'cpuQuota' in cgroup_files and 'cpuPeriod' in cgroup_files:
+            quota = int(readFile(cgroup_files['cpuQuota']).strip())
+            if quota > 0:
+                cpuLimit = quota / int(readFile(cgroup_files['cpuPeriod']).strip())
+        if 'cpuStat' in cgroup_files and cpuLimit != None:
+            self.__attributes['cgroupCPULimit'] = round(cpuLimit, 3)
+
+        if 'memoryMax' in cgroup_files:
+            memoryMax = readFile(cgroup_files['memoryMax']).strip()
+            # cgroup v1 reports an unlimited cgroup as a number close to 2^63.
+            if memoryMax != 'max' and memoryMax != '' and int(memoryMax) < 2 ** 62:
+                self.__attributes['cgroupMemoryMax'] = int(memoryMax)
+
+    #
+    # Compare cgroup and pressure stall values to when inspectCGroup was called.
+    #
+    # XDelta:                  Change in each inspectCGroup counter X, e.g. cgroupThrottledTimeDelta.
+    # cgroupThrottledRatio:    The fraction of elapsed quota periods that were throttled.
+    #
+    def inspectCGroupDelta(self):
+        if (self.__inspectedCGroup):
+            self.__inspectedCGroupDelta = True
+
+            stats = self.__readCGroupStats()
+            for metric in stats:
+                if metric in self.__cgroupStart:
+                    self.__attributes[metric + 'Delta'] = stats[metric] - self.__cgroupStart[metric]
+            if self.__attributes.get('cgroupPeriodsDelta', 0) > 0:
+                self.__attributes['cgroupThrottledRatio'] = round(self.__attributes['cgroupThrottledPeriodsDelta'] /
+                                                                  self.__attributes['cgroupPeriodsDelta'], 3)
+        else:
+            self.__attributes['SAAFCGroupDeltaError'] = "CGroup not inspected before collecting deltas!"
+
+    #
+    # Start tracing Python memory allocations with tracemalloc. Tracing continues
+    # through warm invocations so growth across the lifetime of the container can be
+    # measured. Tracing slows down allocations, so only use this when investigating
+    # memory use.
+    #
+    # allocationStart:   Memory in bytes traced at the start of the invocation.
+    #
+    # @param top The number of allocation sites to return in inspectAllocationsDelta.
+    #
+    def inspectAllocations(self, top = 10):
+        global allocation_baseline
+        self.__inspectedAllocations = True
+        self.__allocationTop = top
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # reset_peak needs Python 3.9, older versions report the peak since tracing started.
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        if (allocation_baseline == None):
+            allocation_baseline = current
+
+        self.__allocationStart = current
+        self.__attributes['allocationStart'] = current
+
+    #
+    # Compare traced memory to when inspectAllocations was called.
+    #
+    # allocationPeak:           Peak traced memory in bytes during the invocation.
+    # allocationGrowth:         Net traced memory in bytes allocated during the invocation.
+    # allocationContainerGrowth: Net traced memory in bytes allocated since tracing started in this container.
+    # allocationSites:          The top allocation sites as [file:line, size in bytes, number of blocks].
+    # allocationGrowthSites:    The top sites by growth since the end of the previous traced
+    #                           invocation as [file:line, size change in bytes, block count change].
+    #
+    def inspectAllocationsDelta(self):
+        global allocation_baseline
+        global allocation_snapshot
+        if (self.__inspectedAllocations and tracemalloc.is_tracing()):
+            self.__inspectedAllocationsDelta = True
+
+            current, peak = tracemalloc.get_traced_memory()
+            self.__attributes['allocationPeak'] = peak
+            self.__attributes['allocationGrowth'] = current - self.__allocationStart
+            self.__attributes['allocationContainerGrowth'] = current - allocation_baseline
+
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)
+            ])
+            def site(stat):
+                return stat.traceback[0].filename + ":" + str(stat.traceback[0].lineno)
+
+            self.__attributes['allocationSites'] = [[site(stat), stat.size, stat.count]
+                                                    for stat in snapshot.statistics('lineno')[:self.__allocationTop]]
+            if (allocation_snapshot != None):
+                growth = [stat for stat in snapshot.compare_to(allocation_snapshot, 'lineno') if stat.size_diff > 0]
+                self.__attributes['allocationGrowthSites'] = [[site(stat), stat.size_diff, stat.count_diff]
+                                                              for stat in growth[:self.__allocationTop]]
+            allocation_snapshot = snapshot
+        else:
+            self.__attributes['SAAFAllocationsDeltaError'] = "Allocations not inspected before collecting deltas!"
+
+    #
+    # Register a garbage collector callback that records the pause time of every
+    # collection until inspectGCDelta or finish is called.
+    #
+    def inspectGC(self):
+        global gc_counters
+        if (self.__inspectedGC):
+            return
+        self.__inspectedGC = True
+        self.__gcCounters = {"start": 0, "collections": [0, 0, 0], "collected": [0, 0, 0],
+                             "pauseTime": [0, 0, 0], "pauseMax": [0, 0, 0]}
+        gc_counters = self.__gcCounters
+        if recordGC not in gc.callbacks:
+            gc.callbacks.append(recordGC)
+
+    #
+    # Stop recording garbage collections.
+    #
+    def __stopGC(self):
+        global gc_counters
+        gc_counters = None
+        if recordGC in gc.callbacks:
+            gc.callbacks.remove(recordGC)
+
+    #
+    # Stop recording garbage collections and add the results. Each attribute is a
+    # list with one value for each generation (0, 1, 2).
+    #
+    # gcCollections:   The number of collections.
+    # gcCollected:     The number of objects collected.
+    # gcPauseTime:     Total time in ms spent collecting.
+    # gcPauseMax:      The longest collection in ms.
+    # gcFrozen:        The number of objects in the permanent generation, see freezeGC.
+    #
+    def inspectGCDelta(self):
+        if (self.__inspectedGC):
+            if (self.__inspectedGCDelta):
+                return
+            self.__inspectedGCDelta = True
+            if gc_counters is self.__gcCounters:
+                self.__stopGC()
+
+            counters = self.__gcCounters
+            self.__attributes['gcCollections'] = counters["collections"]
+            self.__attributes['gcCollected'] = counters["collected"]
+            self.__attributes['gcPauseTime'] = [round(pause / 1000000, 3) for pause in counters["pauseTime"]]
+            self.__attributes['gcPauseMax'] = [round(pause / 1000000, 3) for pause in counters["pauseMax"]]
+            self.__attributes['gcFrozen'] = gc.get_freeze_count()
+        else:
+            self.__attributes['SAAFGCDeltaError'] = "GC not inspected before collecting deltas!"
+
+    #
+    # Stop the import tracer started by traceImports and add the slowest imports.
+    # Only the first invocation of a container returns these attributes.
+    #
+    # importTime:      Total time in ms spent in top level imports while tracing.
+    # importCount:     The number of modules imported while tracing.
+    # importsSlowest:  The slowest imports as [module, cumulative ms, self ms].
+    #
+    # @param top The number of imports to return.
+    #
+    def inspectImports(self, top = 10):
+        global import_times
+        global import_total
+        if (import_original == None):
+            return
+        stopTraceImports()
+
+        slowest = sorted(import_times.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        self.__attributes['importTime'] = round(import_total / 1000000, 3)
+        self.__attributes['importCount'] = len(import_times)
+        self.__attributes['importsSlowest'] = [[name, round(times[0] / 1000000, 3), round(times[1] / 1000000, 3)]
+                                               for name, times in slowest]
+        import_times = {}
+
+    #
+    # Run a short calibration of the host so runtimes from different CPUs can be
+    # normalized. The calibration takes a few ms and runs once per container; warm
+    # invocations return the cached result.
+    #
+    # hostCPUScore:           Iterations per ms of a fixed integer and float loop.
+    # hostMemoryBandwidth:    MB/s copying within a preallocated 4 MB buffer.
+    # hostTmpWriteThroughput: MB/s writing and syncing 1 MB to /tmp, left out if /tmp is not writable.
+    # hostSpeedRuntime:       Time in ms the calibration took in this container.
+    #
+    def inspectHostSpeed(self):
+        global host_speed
+        if (host_speed == None):
+            calibrationStart = time.perf_counter()
+
+            iterations = 20000
+            startTime = time.perf_counter()
+            integer = 0
+            real = 1.0
+            for i in range(iterations):
+                integer = (integer + i * 7) % 1000003
+                real = real * 1.000001 + 0.5
+            cpuScore = iterations / ((time.perf_counter() - startTime) * 1000)
+
+            size = 4 * 1024 * 1024
+            half = size // 2
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            copies = 8
+            startTime = time.perf_counter()
+            for i in range(copies):
+                if i % 2 == 0:
+                    view[half:] = view[:half]
+                else:
+                    view[:half] = view[half:]
+            memoryBandwidth = (half * copies / (1024 * 1024)) / (time.perf_counter() - startTime)
+
+            tmpWriteThroughput = None
+            path = '/tmp/saaf-host-speed'
+            try:
+                startTime = time.perf_counter()
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                try:
+                    os.write(fd, view[:1024 * 1024])
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                tmpWriteThroughput = round(1 / (time.perf_counter() - startTime), 2)
+                os.remove(path)
+            except Exception:
+                pass
+            view.release()
+
+            host_speed = {
+                "hostCPUScore": round(cpuScore, 2),
+                "hostMemoryBandwidth": round(memoryBandwidth, 2),
+                "hostSpeedRuntime": round((time.perf_counter() - calibrationStart) * 1000, 3)
+            }
+            if (tmpWriteThroughput != None):
+                host_speed["hostTmpWriteThroughput"] = tmpWriteThroughput
+        self.__attributes.update(host_speed)
+
     #
     # Collect information about the current FaaS platform.
     #
@@ -306,6 +1963,9 @@ class Inspector:
     #
     def inspectPlatform(self):
         self.__inspectedPlatform = True
+        if (self.__loadCache('platform')):
+            return
+        before = dict(self.__attributes)
 
         key = os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME', None)
         if (key != None):
@@ -315,7 +1975,7 @@ class Inspector:
             self.__attributes['functionMemory'] = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', None)
             self.__attributes['functionRegion'] = os.environ.get('AWS_REGION', None)
 
-            vmID = runCommand('cat /proc/self/cgroup | grep 2:cpu').replace('\n', '')
+            vmID = getCGroupCPU(self.__useShell)
             self.__attributes['vmID'] = vmID[20: 26]
         else:
             key = os.environ.get('X_GOOGLE_FUNCTION_NAME', None)
@@ -330,7 +1990,7 @@ class Inspector:
                     self.__attributes['platform'] = "IBM Cloud Functions"
                     self.__attributes['functionName'] = key
                     self.__attributes['functionRegion'] = os.environ.get('__OW_API_HOST', None)
-                    self.__attributes["vmID"] = runCommand("cat /sys/hypervisor/uuid").strip()
+                    self.__attributes["vmID"] = getHypervisorUUID(self.__useShell)
 
                 else:
                     key = os.environ.get('CONTAINER_NAME', None)
@@ -349,6 +2009,7 @@ class Inspector:
                             self.__attributes['host_name'] = os.environ.get('HOSTNAME', None)
                         else:
                             self.__attributes['platform'] = "Unknown Platform"
+        self.__saveCache('platform', before)
     
     def __recommendConfiguration(self):
         try:
@@ -375,17 +2036,82 @@ class Inspector:
     #
     def inspectLinux(self):
         self.__inspectedLinux = True
-        self.__attributes['linuxVersion'] = runCommand('uname -a').replace('\n', '')
+        if (self.__loadCache('linux')):
+            return
+        before = dict(self.__attributes)
+        self.__attributes['linuxVersion'] = getKernelVersion(self.__useShell)
+        self.__saveCache('linux', before)
+
+    #
+    # Measure the time saved by collecting platform and kernel information without
+    # spawning processes. This runs the shell commands once, so it should only be
+    # called when measuring SAAF overhead.
+    #
+    # shellRuntime:   Time in ms to collect the information with shell commands.
+    # nativeRuntime:  Time in ms to collect the information with syscalls and file reads.
+    # shellSavings:   Time in ms saved per invocation by not spawning processes.
+    #
+    def inspectShellOverhead(self):
+        timings = {}
+        for useShell in [True, False]:
+            startTime = time.perf_counter()
+            getKernelVersion(useShell)
+            if (os.environ.get('AWS_LAMBDA_LOG_STREAM_NAME', None) != None):
+                getCGroupCPU(useShell)
+            elif (os.environ.get('__OW_ACTION_NAME', None) != None):
+                getHypervisorUUID(useShell)
+            timings[useShell] = (time.perf_counter() - startTime) * 1000
+
+        self.__attributes['shellRuntime'] = round(timings[True], 2)
+        self.__attributes['nativeRuntime'] = round(timings[False], 2)
+        self.__attributes['shellSavings'] = round(timings[True] - timings[False], 2)
         
+    #
+    # Copy cached static attributes into the output.
+    #
+    # @param name The name of the cache entry.
+    # @return Whether the cache entry existed and was used.
+    #
+    def __loadCache(self, name):
+        global static_cache
+        if (self.__useCache and name in static_cache):
+            self.__attributes.update(static_cache[name])
+            return True
+        return False
+
+    #
+    # Cache the attributes that were added or changed since a snapshot was taken.
+    #
+    # @param name The name of the cache entry.
+    # @param before A copy of the attributes taken before collecting data.
+    #
+    def __saveCache(self, name, before):
+        global static_cache
+        if (self.__useCache):
+            static_cache[name] = {key: value for key, value in self.__attributes.items()
+                                  if key not in before or before[key] is not value}
+
     #
     # Run all data collection methods and record framework runtime.
     #
     def inspectAll(self):
+        if not self.__sampled:
+            return
         self.inspectContainer()
         self.inspectCPUInfo()
+        self.inspectCPUTopology()
+        # The CPU frequency is not available on some hosts, such as arm64 without cpufreq.
+        if (cpu_frequency_available != False):
+            self.inspectCPUFrequency(reportMissing = False)
         self.inspectPlatform()
         self.inspectLinux()
         self.inspectMemory()
+        self.inspectNetwork()
+        if (self.__collectIO):
+            self.inspectIO()
+        self.inspectResources()
+        self.inspectCGroup()
+        self.inspectGC()
         self.inspectCPU()
         self.addTimeStamp("frameworkRuntime")
 
@@ -394,6 +2120,8 @@ class Inspector:
     # use code runtime from time spent collecting data.
     #
     def inspectAllDeltas(self):
+        if not self.__sampled:
+            return
 
         # Add the 'userRuntime' timestamp.
         if ('frameworkRuntime' in self.__attributes):
@@ -402,9 +2130,81 @@ class Inspector:
         deltaTime = int(round(time.time() * 1000))
         self.inspectCPUDelta()
         self.inspectMemoryDelta()
+        self.inspectNetworkDelta()
+        if (self.__collectIO):
+            self.inspectIODelta()
+        self.inspectResourcesDelta()
+        self.inspectCGroupDelta()
+        self.inspectGCDelta()
+        if (self.__inspectedCPUFrequency):
+            self.inspectCPUFrequencyDelta()
         self.__recommendConfiguration()
         self.addTimeStamp("frameworkRuntimeDeltas", deltaTime)
         
+    #
+    # Whether this invocation is inspected by inspectAll and inspectAllDeltas. Use
+    # this to skip other expensive instrumentation on invocations that are not sampled.
+    #
+    # @return False if a sampling policy skipped this invocation.
+    #
+    def isSampled(self):
+        return self.__sampled
+
+    #
+    # Add the metrics of this invocation to the rolling container aggregates and
+    # return the summary of the current window if it is complete.
+    #
+    # summary:   Histograms of each metric in aggregate_metrics for the invocations
+    #            in the window. See Histogram.export.
+    # summaryInvocations: The number of invocations in the window.
+    # summaryWindow: The time in ms covered by the window.
+    #
+    # @return The summary attributes, or an empty dictionary.
+    #
+    def __aggregate(self):
+        global aggregates
+        global aggregate_count
+        global aggregate_start
+
+        for metric in aggregate_metrics:
+            value = self.__attributes.get(metric, None)
+            if isinstance(value, list):
+                value = sum(value)
+            if isinstance(value, (int, float)):
+                if metric not in aggregates:
+                    aggregates[metric] = Histogram()
+                aggregates[metric].add(value)
+        aggregate_count += 1
+
+        now = int(round(time.time() * 1000))
+        if ((self.__summaryEvery != None and aggregate_count >= self.__summaryEvery) or
+                (self.__summaryInterval != None and now - aggregate_start >= self.__summaryInterval * 1000)):
+            summary = {
+                "summary": {metric: aggregates[metric].export() for metric in aggregates},
+                "summaryInvocations": aggregate_count,
+                "summaryWindow": now - aggregate_start
+            }
+            aggregates = {}
+            aggregate_count = 0
+            aggregate_start = now
+            return summary
+        return {}
+
+    #
+    # Whether an attribute is returned by the selected attribute profile.
+    #
+    # @param key The name of the attribute.
+    #
+    def __inProfile(self, key):
+        if key in self.__excludeAttributes:
+            return False
+        if (key in self.__includeAttributes or key in self.__customAttributes or key.startswith('SAAF')
+                or self.__attributeProfile == "full"):
+            return True
+        if self.__attributeProfile == "minimal":
+            return key in minimal_attributes
+        return key not in standard_excluded_attributes
+
     #
     # Add a custom attribute to the output.
     #
@@ -413,6 +2213,7 @@ class Inspector:
     #
     def addAttribute(self, key, value):
         self.__attributes[key] = value
+        self.__customAttributes.add(key)
         
     #
     # Gets a custom attribute from the attribute list.
@@ -423,6 +2224,27 @@ class Inspector:
     def getAttribute(self, key):
         return self.__attributes[key]
         
+    #
+    # Time a phase of the function with nanosecond resolution. Spans can be nested
+    # and repeated spans at the same position, such as inside a loop, are aggregated.
+    # Spans should be entered and exited on the same thread.
+    #
+    #   with inspector.span("download"):
+    #       ...
+    #
+    #   @inspector.span("transform")
+    #   def transform(data):
+    #       ...
+    #
+    # @param name The name of the span.
+    # @return A Span usable as a context manager or decorator.
+    #
+    def span(self, name):
+        span = self.__spans.get(name)
+        if span is None:
+            span = self.__spans[name] = Span(name, self.__spanNodes, self.__spanStarts)
+        return span
+
     #
     # Add custom time stamps to the output. The key value determines the name
     # of the attribute and the value will be the time from Inspector initialization
@@ -438,11 +2260,32 @@ class Inspector:
         
     #
     # Finalize the Inspector. Calculator the total runtime and return the dictionary
-    # object containing all attributes collected.
+    # object containing all attributes collected. With summaryEvery or summaryInterval
+    # set only the aggregate_fields and any completed summary are returned.
     #
     # @return Attributes collected by the Inspector.
     #
     def finish(self):
+        self.stopProfile()
+        self.stopSampler()
+        self.inspectImports()
+        if (self.__inspectedGC):
+            self.inspectGCDelta()
+
+        # Objects that survived the first invocation are mostly imports and globals
+        # that live as long as the container, so they no longer need to be scanned.
+        if (self.__freezeGC and gc.get_freeze_count() == 0):
+            gc.freeze()
+        if self.__spanRoot.children:
+            self.__attributes['spans'] = self.__spanRoot.export()[5]
         self.addTimeStamp('runtime')
         self.__attributes['endTime'] = int(round(time.time() * 1000))
+
+        if (self.__summaryEvery != None or self.__summaryInterval != None):
+            summary = self.__aggregate()
+            attributes = {key: self.__attributes[key] for key in aggregate_fields if key in self.__attributes}
+            attributes.update(summary)
+            return attributes
+        if (self.__attributeProfile != "full" or len(self.__excludeAttributes) > 0):
+            return {key: value for key, value in self.__attributes.items() if self.__inProfile(key)}
         return self.__attributes
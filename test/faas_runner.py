@@ -34,6 +34,19 @@ defaultFunction = {
 defaultExperiment = {
     'callWithCLI': True,
     'callAsync': False,
+    'awsInvoker': 'cli',
+    'awsEndpointURL': '',
+    'awsRegion': '',
+    'maxPoolConnections': 10,
+    'reuseConnections': True,
+    'httpPoolSize': 10,
+    'httpConnectTimeout': 10,
+    'httpReadTimeout': 450,
+    'engine': 'threads',
+    'maxInFlight': 0,
+    'arrivalProcess': {},
+    'correctCoordinatedOmission': False,
+    'expectedInterval': 0,
     'memorySettings': [],
     'parentPayload': {},
     'payloads': [{}],
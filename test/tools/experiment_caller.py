@@ -7,22 +7,47 @@
 # @author Robert Cordingly
 #
 import ast
+import asyncio
 import datetime
 import json
+import math
 import os
 import random
 import requests
 import subprocess
 import sys
+import threading
 import time
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 from pipeline_transition import transition_function
+from latency_histogram import LatencyHistogram
+
+# boto3 is only needed when the SDK invoker is used.
+try:
+    import boto3
+    import botocore.config
+except ImportError:
+    boto3 = None
+
+# aiohttp is only needed by the async engine.
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # Results of calls will be placed into this array.
 run_results = []
 max_runs = 0
 
+# The default number of threads of open loop experiments with the threads engine.
+max_open_loop_threads = 256
+
+# Round trip time histograms of each worker of the current experiment, keyed by thread.
+worker_histograms = {}
+histogram_lock = threading.Lock()
+
 
 def get_aws_version():
     try:
@@ -40,14 +65,64 @@ def get_aws_version():
     except Exception as e:
         raise f"An error occurred: {e}"
 
-# Example usage:
-aws_version = get_aws_version()
+# Version of the AWS CLI, found on the first CLI call.
+aws_version = None
+
+# Each thread keeps its own Lambda client and HTTP session so that connections are reused between calls.
+thread_clients = threading.local()
+
+#
+# Get the HTTP session of this thread, creating it on first use.
+#
+def getHTTPSession(exp):
+    session = getattr(thread_clients, 'httpSession', None)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=exp['httpPoolSize'],
+            pool_maxsize=exp['httpPoolSize'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        thread_clients.httpSession = session
+    return session
+
+#
+# Get the Lambda client of this thread, creating it on first use.
+#
+def getLambdaClient(exp):
+    client = getattr(thread_clients, 'lambdaClient', None)
+    if client is None:
+        if boto3 is None:
+            raise Exception("boto3 is not installed. Install boto3 to use the sdk awsInvoker.")
+        config = botocore.config.Config(max_pool_connections=exp['maxPoolConnections'],
+            read_timeout=450, connect_timeout=10, retries={'max_attempts': 0})
+        session = boto3.session.Session()
+        client = session.client('lambda', config=config,
+            endpoint_url=exp['awsEndpointURL'] or None, region_name=exp['awsRegion'] or None)
+        thread_clients.lambdaClient = client
+    return client
+
+#
+# Make a call using the AWS SDK with a client reused by the calling thread.
+#
+def callAWSSDK(function, payload, callAsync, exp):
+    client = getLambdaClient(exp)
+    invocationType = 'Event' if callAsync else 'RequestResponse'
+    response = client.invoke(FunctionName=str(function['endpoint']), InvocationType=invocationType,
+        Payload=payload.encode('utf-8'))
+    body = response['Payload'].read().decode('utf-8')
+    print("Response: " + str(response['StatusCode']) + " " + body)
+
+    if (callAsync):
+        return '{"RESPONSE": "USE S3 PULL TO RETRIEVE RESPONSES", "version":42}'
+    return body
 
 #
 # Make a call using AWS CLI
 #
 def callAWS(function, payload, callAsync):
     global aws_version
+    if (aws_version == None):
+        aws_version = get_aws_version()
     
     if (aws_version >= 2):
         cmd = ['aws', 'lambda', 'invoke', '--invocation-type', 'RequestResponse', '--cli-read-timeout', 
@@ -101,24 +176,107 @@ def callIBM(function, payload):
     return str(o.decode('ascii'))
 
 #
-# Make a call using a regular HTTP request
+# Make a call using a regular HTTP request. With reuseConnections the thread's
+# keep-alive session is used, otherwise each call opens and closes a new connection.
 #
-def callHTTP(function, payload):
-    response = requests.post(function['endpoint'], data=
-        payload, headers={'content-type': 'application/json'})
+def callHTTP(function, payload, exp):
+    timeout = (exp['httpConnectTimeout'], exp['httpReadTimeout'])
+    if (exp['reuseConnections']):
+        response = getHTTPSession(exp).post(function['endpoint'], data=
+            payload, headers={'content-type': 'application/json'}, timeout=timeout)
+    else:
+        response = requests.post(function['endpoint'], data=
+            payload, headers={'content-type': 'application/json', 'connection': 'close'}, timeout=timeout)
     print("Response: " + str(response))
     return response.text
 
+#
+# Make a call using a regular HTTP request on the event loop.
+#
+async def callHTTPAsync(session, function, payload):
+    async with session.post(function['endpoint'], data=payload,
+        headers={'content-type': 'application/json'}) as response:
+        text = await response.text()
+        print("Response: " + str(response.status))
+        return text
+
+#
+# Get the round trip time and corrected round trip time histograms of the calling worker.
+#
+def getWorkerHistograms():
+    key = threading.get_ident()
+    with histogram_lock:
+        if key not in worker_histograms:
+            worker_histograms[key] = (LatencyHistogram(), LatencyHistogram())
+        return worker_histograms[key]
+
+#
+# Record the round trip time of a call in the histograms of the calling worker. With
+# correctCoordinatedOmission, open loop calls are also recorded from their intended send
+# time and closed loop calls are corrected with the expectedInterval between calls.
+#
+# @param startTime The perf_counter_ns before the call.
+# @param endTime The perf_counter_ns after the call.
+# @param intendedTime The perf_counter_ns the call was meant to be sent in open loop experiments.
+# @return The round trip time in ms.
+#
+def recordRoundTripTime(exp, startTime, endTime, intendedTime=None):
+    roundTrip, corrected = getWorkerHistograms()
+    elapsed = (endTime - startTime) // 1000
+    roundTrip.record(elapsed)
+    if (exp['correctCoordinatedOmission']):
+        if (intendedTime != None):
+            corrected.record((endTime - intendedTime) // 1000)
+        else:
+            corrected.recordCorrected(elapsed, int(exp['expectedInterval'] * 1000))
+    return round((endTime - startTime) / 10000) / 100
+
+#
+# Merge the histograms of every worker of the last experiment. correctedRoundTripTime
+# is only included when coordinated omission correction was used.
+#
+def getLatencyHistograms():
+    histograms = {'roundTripTime': LatencyHistogram(), 'correctedRoundTripTime': LatencyHistogram()}
+    with histogram_lock:
+        for (roundTrip, corrected) in worker_histograms.values():
+            histograms['roundTripTime'].merge(roundTrip)
+            histograms['correctedRoundTripTime'].merge(corrected)
+    if (histograms['correctedRoundTripTime'].totalCount == 0):
+        del histograms['correctedRoundTripTime']
+    return histograms
+
+#
+# Make a call depending on platform.
+#
+def callFunction(function, payload, exp):
+    platform = function['platform']
+    callAsync = exp['callAsync']
+    response = ""
+    if (platform == 'HTTP' or platform == 'Azure'):
+        response = callHTTP(function, payload, exp)
+    elif (platform == 'AWS Lambda' and exp['awsInvoker'] == 'sdk'):
+        response = callAWSSDK(function, payload, callAsync, exp)
+    elif (platform == 'AWS Lambda'):
+        response = callAWS(function, payload, callAsync)
+    elif (platform == 'Google'):
+        response = callGoogle(function, payload)
+    elif (platform == 'IBM'):
+        response = callIBM(function, payload)
+    return response
+
 #
 # Called after a request is made, appends extra data to the payload.
+# Attributes in extra, such as send times of open loop experiments, are added to the result.
 #
-def callPostProcessor(function, response, thread_id, run_id, payload, roundTripTime, pipelineStage):
+def callPostProcessor(function, response, thread_id, run_id, payload, roundTripTime, pipelineStage, extra=None):
     try:
         dictionary = ast.literal_eval(response)
         dictionary['2_thread_id'] = thread_id
         dictionary['1_run_id'] = run_id
         if pipelineStage != -1:
             dictionary['3_pipeline_stage'] = pipelineStage
+        if extra != None:
+            dictionary.update(extra)
         dictionary['zAll'] = "Final Results:"
         dictionary['roundTripTime'] = roundTripTime
         dictionary['payload'] = str(payload)
@@ -167,8 +325,6 @@ def callPostProcessor(function, response, thread_id, run_id, payload, roundTripT
 # Define a function to be called by each thread.
 #
 def callThread(thread_id, runs, function, exp, myPayloads):
-    callAsync = exp['callAsync']
-
     for i in range(0, runs): 
 
         callPayload = myPayloads[i]
@@ -180,24 +336,224 @@ def callThread(thread_id, runs, function, exp, myPayloads):
         # Format payload for CLIs.
         payload = str(json.dumps(callPayload))
 
-        startTime = time.time()
-        platform = function['platform']
-        response = ""
+        startTime = time.perf_counter_ns()
+        response = callFunction(function, payload, exp)
 
-        # Make call depending on platform.
-        if (platform == 'HTTP' or platform == 'Azure'):
-            response = callHTTP(function, payload)
-        elif (platform == 'AWS Lambda'):
-            response = callAWS(function, payload, callAsync)
-        elif (platform == 'Google'):
-            response = callGoogle(function, payload)
-        elif (platform == 'IBM'):
-            response = callIBM(function, payload)
+        timeSinceStart = recordRoundTripTime(exp, startTime, time.perf_counter_ns())
 
-        timeSinceStart = round((time.time() - startTime) * 100000) / 100
+        callPostProcessor(function, response, thread_id, i, payload, timeSinceStart, -1)
+
+#
+# Define a coroutine to be called by each worker of the async engine. Workers call
+# sequentially like threads, while the semaphore bounds calls in flight over all workers.
+#
+async def callWorkerAsync(thread_id, runs, function, exp, myPayloads, session, semaphore):
+    for i in range(0, runs):
+
+        callPayload = myPayloads[i]
+        payload = str(json.dumps(callPayload))
+
+        async with semaphore:
+            startTime = time.perf_counter_ns()
+            try:
+                response = await callHTTPAsync(session, function, payload)
+            except Exception as e:
+                print("Run " + str(thread_id) + "." + str(i) + " Failed with exception: " + str(e))
+                continue
+            timeSinceStart = recordRoundTripTime(exp, startTime, time.perf_counter_ns())
 
         callPostProcessor(function, response, thread_id, i, payload, timeSinceStart, -1)
 
+#
+# Run all workers of an experiment on one event loop.
+#
+async def callWorkersAsync(workers, exp):
+    maxInFlight = exp['maxInFlight']
+    if (maxInFlight <= 0):
+        maxInFlight = len(workers)
+    semaphore = asyncio.Semaphore(maxInFlight)
+    connector = aiohttp.TCPConnector(limit=maxInFlight, force_close=not exp['reuseConnections'])
+    timeout = aiohttp.ClientTimeout(sock_connect=exp['httpConnectTimeout'], sock_read=exp['httpReadTimeout'])
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*[callWorkerAsync(thread_id, runs, function, exp, myPayloads, session, semaphore)
+            for (thread_id, runs, function, myPayloads) in workers])
+
+#
+# Get the expected number of arrivals of a ramp or step arrival process as a list
+# of (duration, startRate, endRate) segments. The last rate continues forever.
+#
+def getArrivalSegments(arrival):
+    if (arrival['type'] == 'ramp'):
+        return [(arrival['duration'], arrival['startRate'], arrival['endRate'])]
+    return [(duration, rate, rate) for (duration, rate) in arrival['steps']]
+
+#
+# Check that an arrival process can be scheduled.
+#
+# @return A description of the problem, or None if the arrival process is valid.
+#
+def validateArrivalProcess(arrival):
+    kind = arrival.get('type', None)
+    try:
+        if (kind == 'constant' or kind == 'poisson'):
+            if (arrival['rate'] <= 0):
+                return "rate must be > 0."
+        elif (kind == 'burst'):
+            if (arrival['burstSize'] < 1 or arrival['burstInterval'] < 0):
+                return "burstSize must be >= 1 and burstInterval >= 0."
+        elif (kind == 'ramp' or kind == 'step'):
+            segments = getArrivalSegments(arrival)
+            if (len(segments) == 0):
+                return "steps must not be empty."
+            for (duration, startRate, endRate) in segments:
+                if (duration <= 0 or startRate < 0 or endRate < 0):
+                    return "durations must be > 0 and rates >= 0."
+        else:
+            return "unknown type " + str(kind) + "."
+    except (KeyError, TypeError, ValueError) as e:
+        return "missing or invalid attribute " + str(e) + "."
+    return None
+
+#
+# Get the intended send time, in seconds from the start of the experiment, of each request
+# of an arrival process:
+#
+# constant: {"type": "constant", "rate": 10}
+# poisson:  {"type": "poisson", "rate": 10}
+# ramp:     {"type": "ramp", "startRate": 1, "endRate": 50, "duration": 60}
+# step:     {"type": "step", "steps": [[30, 5], [30, 20], [30, 5]]}
+# burst:    {"type": "burst", "burstSize": 100, "burstInterval": 10}
+#
+# Rates are in requests per second and durations in seconds. Ramp and step requests are
+# sent when the expected number of arrivals reaches each request. If a ramp or step ends
+# with a rate of 0, the schedule ends at the last arrival and may hold fewer than count
+# requests.
+#
+def getArrivalSchedule(arrival, count):
+    kind = arrival['type']
+    if (kind == 'constant'):
+        return [i / arrival['rate'] for i in range(count)]
+    elif (kind == 'poisson'):
+        schedule = [0.0]
+        while (len(schedule) < count):
+            schedule.append(schedule[-1] + random.expovariate(arrival['rate']))
+        return schedule
+    elif (kind == 'burst'):
+        return [(i // arrival['burstSize']) * arrival['burstInterval'] for i in range(count)]
+    elif (kind == 'ramp' or kind == 'step'):
+        segments = getArrivalSegments(arrival)
+        schedule = []
+        start = 0.0
+        arrived = 0.0
+        for (duration, startRate, endRate) in segments:
+            slope = (endRate - startRate) / duration
+            total = startRate * duration + slope * duration * duration / 2
+            while (len(schedule) < count and len(schedule) < arrived + total):
+                needed = len(schedule) - arrived
+                if (slope == 0):
+                    offset = needed / startRate
+                else:
+                    offset = (math.sqrt(startRate * startRate + 2 * slope * needed) - startRate) / slope
+                schedule.append(start + offset)
+            start += duration
+            arrived += total
+        lastRate = segments[-1][2]
+        while (len(schedule) < count and lastRate > 0):
+            schedule.append(start + (len(schedule) - arrived) / lastRate)
+        return schedule
+    raise Exception("Unknown arrival process type: " + str(kind))
+
+#
+# Make one call of an open loop experiment and record when it was meant to be sent.
+#
+def callScheduled(thread_id, run_id, function, exp, callPayload, experimentStart, intendedTime):
+    payload = str(json.dumps(callPayload))
+
+    startTime = time.perf_counter_ns()
+    try:
+        response = callFunction(function, payload, exp)
+    except Exception as e:
+        print("Run " + str(thread_id) + "." + str(run_id) + " Failed with exception: " + str(e))
+        return
+    timeSinceStart = recordRoundTripTime(exp, startTime, time.perf_counter_ns(), intendedTime)
+
+    callPostProcessor(function, response, thread_id, run_id, payload, timeSinceStart, -1,
+        getSendTimes(experimentStart, intendedTime, startTime))
+
+#
+# Get the intended and actual send times of a call, in ms from the start of the experiment.
+# All times are from perf_counter_ns.
+#
+def getSendTimes(experimentStart, intendedTime, startTime):
+    intendedSendTime = round((intendedTime - experimentStart) / 10000) / 100
+    actualSendTime = round((startTime - experimentStart) / 10000) / 100
+    return {'intendedSendTime': intendedSendTime, 'actualSendTime': actualSendTime,
+            'sendLag': round((actualSendTime - intendedSendTime) * 100) / 100}
+
+#
+# Run an open loop experiment with threads. Requests are handed to a pool of threads at
+# their intended time, whether or not earlier requests have completed. The pool has
+# maxInFlight threads, or max_open_loop_threads if maxInFlight is 0, so a slow platform
+# cannot make the client start a thread per outstanding request. When every thread is
+# busy, requests wait and the wait is recorded as sendLag.
+#
+def callOpenLoop(function_calls, exp, payloadList, schedule):
+    maxInFlight = exp['maxInFlight']
+    if (maxInFlight <= 0):
+        maxInFlight = max_open_loop_threads
+    maxInFlight = min(maxInFlight, len(schedule) * len(function_calls))
+    with ThreadPoolExecutor(max_workers=maxInFlight) as executor:
+        experimentStart = time.perf_counter_ns()
+        for i in range(len(schedule)):
+            intendedTime = experimentStart + int(schedule[i] * 1000000000)
+            delay = intendedTime - time.perf_counter_ns()
+            if (delay > 0):
+                time.sleep(delay / 1000000000)
+            for j in range(len(function_calls)):
+                executor.submit(callScheduled, j, i, function_calls[j], exp, payloadList[i], experimentStart, intendedTime)
+
+#
+# Make one call of an open loop experiment on the event loop.
+#
+async def callScheduledAsync(thread_id, run_id, function, exp, callPayload, experimentStart, intendedTime,
+                             session, semaphore):
+    payload = str(json.dumps(callPayload))
+
+    async with semaphore:
+        startTime = time.perf_counter_ns()
+        try:
+            response = await callHTTPAsync(session, function, payload)
+        except Exception as e:
+            print("Run " + str(thread_id) + "." + str(run_id) + " Failed with exception: " + str(e))
+            return
+        timeSinceStart = recordRoundTripTime(exp, startTime, time.perf_counter_ns(), intendedTime)
+
+    callPostProcessor(function, response, thread_id, run_id, payload, timeSinceStart, -1,
+        getSendTimes(experimentStart, intendedTime, startTime))
+
+#
+# Run an open loop experiment on one event loop. Each request is a new task started at its intended time.
+#
+async def callOpenLoopAsync(function_calls, exp, payloadList, schedule):
+    maxInFlight = exp['maxInFlight']
+    if (maxInFlight <= 0):
+        maxInFlight = len(schedule) * len(function_calls)
+    semaphore = asyncio.Semaphore(maxInFlight)
+    connector = aiohttp.TCPConnector(limit=maxInFlight, force_close=not exp['reuseConnections'])
+    timeout = aiohttp.ClientTimeout(sock_connect=exp['httpConnectTimeout'], sock_read=exp['httpReadTimeout'])
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = []
+        experimentStart = time.perf_counter_ns()
+        for i in range(len(schedule)):
+            intendedTime = experimentStart + int(schedule[i] * 1000000000)
+            delay = intendedTime - time.perf_counter_ns()
+            if (delay > 0):
+                await asyncio.sleep(delay / 1000000000)
+            for j in range(len(function_calls)):
+                tasks.append(asyncio.create_task(callScheduledAsync(j, i, function_calls[j], exp, payloadList[i],
+                    experimentStart, intendedTime, session, semaphore)))
+        await asyncio.gather(*tasks)
+
 #
 # Define a pipeline to be called by each thread.
 #
@@ -213,8 +569,6 @@ def callPipelineThread(thread_id, seqIterations, functions, experiments, myPaylo
             exp = experiments[i]
             callPayload = myPayloads[i + (j * len(functions))]
 
-            callAsync = exp['callAsync']
-
             startTime = 0
             response = None
 
@@ -233,22 +587,11 @@ def callPipelineThread(thread_id, seqIterations, functions, experiments, myPaylo
             print("Call Function: " + str(function))
             print("Call Payload: " + str(callPayload))
 
-            startTime = time.time()
-            platform = function['platform']
-            response = ""
-
-            # Make call depending on platform.
-            if (platform == 'HTTP' or platform == 'Azure'):
-                response = callHTTP(function, payload)
-            elif (platform == 'AWS Lambda'):
-                response = callAWS(function, payload, callAsync)
-            elif (platform == 'Google'):
-                response = callGoogle(function, payload)
-            elif (platform == 'IBM'):
-                response = callIBM(function, payload)
+            startTime = time.perf_counter_ns()
+            response = callFunction(function, payload, exp)
 
             # Calculate round trip time
-            timeSinceStart = round((time.time() - startTime) * 100000) / 100
+            timeSinceStart = recordRoundTripTime(exp, startTime, time.perf_counter_ns())
 
             passOn = callPostProcessor(function, response, thread_id, j, payload, timeSinceStart, i)
 
@@ -271,6 +614,7 @@ def callExperiment(functionList, exp):
 
     global run_results
     run_results = []
+    worker_histograms.clear()
 
     threads = exp['threads']
     total_runs = exp['runs']
@@ -312,24 +656,67 @@ def callExperiment(functionList, exp):
         random.shuffle(payloadList)
 
     #
-    # Create threads and distribute payloads to threads.
+    # Distribute payloads to workers.
     #
     payloadIndex = 0
-    try:
-        threadList = []
-        for i in range(0, threads):
-            for j in range(len(function_calls)):
+    workers = []
+    for i in range(0, threads):
+        for j in range(len(function_calls)):
+
+            payloadsForThread = []
+            while (len(payloadsForThread) < runs_per_thread):
+                payloadsForThread.append(payloadList[payloadIndex])
+                payloadIndex += 1
+
+            workers.append((i, runs_per_thread, function_calls[j], payloadsForThread))
+
+    #
+    # The async engine runs every worker on one event loop. It only makes HTTP calls.
+    #
+    engine = exp['engine']
+    if (engine == 'async'):
+        if (aiohttp == None):
+            print("WARNING - aiohttp is not installed. Using the threads engine.")
+            engine = 'threads'
+        elif (len([f for f in function_calls if f['platform'] != "HTTP" and f['platform'] != "Azure"]) > 0):
+            print("WARNING - The async engine only supports HTTP calls. Using the threads engine.")
+            engine = 'threads'
 
-                payloadsForThread = []
-                while (len(payloadsForThread) < runs_per_thread):
-                    payloadsForThread.append(payloadList[payloadIndex])
-                    payloadIndex += 1
+    #
+    # Open loop experiments send requests on an arrival schedule instead of back to back.
+    #
+    arrivalProcess = exp['arrivalProcess']
+    if (arrivalProcess):
+        problem = validateArrivalProcess(arrivalProcess)
+        if (problem != None):
+            print("ERROR! Invalid arrivalProcess: " + problem)
+            return None
+        schedule = getArrivalSchedule(arrivalProcess, total_runs)
+        if (len(schedule) == 0):
+            print("ERROR! The arrival process has no arrivals.")
+            return None
+        if (len(schedule) < total_runs):
+            print("WARNING - The arrival process ends after " + str(len(schedule)) + " of " + str(total_runs) + " runs.")
+            max_runs = len(schedule)
 
-                thread = Thread(target=callThread, args=(i, runs_per_thread, function_calls[j], exp, payloadsForThread))
+    try:
+        if (arrivalProcess and engine == 'async'):
+            asyncio.run(callOpenLoopAsync(function_calls, exp, payloadList, schedule))
+        elif (arrivalProcess):
+            callOpenLoop(function_calls, exp, payloadList, schedule)
+        elif (engine == 'async'):
+            asyncio.run(callWorkersAsync(workers, exp))
+        else:
+            #
+            # Create a thread for each worker.
+            #
+            threadList = []
+            for (thread_id, runs, function, payloadsForThread) in workers:
+                thread = Thread(target=callThread, args=(thread_id, runs, function, exp, payloadsForThread))
                 thread.start()
                 threadList.append(thread)
-        for i in range(len(threadList)):
-            threadList[i].join()
+            for i in range(len(threadList)):
+                threadList[i].join()
     except Exception as e:
         print("Error making request: " + str(e))
 
@@ -363,6 +750,7 @@ def callPipelineExperiment(functionList, experimentList):
 
     global run_results
     run_results = []
+    worker_histograms.clear()
 
     if (len(functionList) != len(experimentList)):
         print("ERROR! For pipelines an equal number of experiments and functions must be provided!")
@@ -16,6 +16,7 @@ from enum import Enum
 
 from experiment_caller import callExperiment
 from experiment_caller import callPipelineExperiment
+from experiment_caller import getLatencyHistograms
 from report_generator import report
 from report_generator import write_file
 
@@ -196,6 +197,7 @@ def run_experiment(functions, experiments, outDir):
         print("Sleeping after setting memory value...")
         time.sleep(sleepTime)
         runList = []
+        histogramList = []
 
         for i in range(iterations):
             print("Running test " + str(i) + ": ")
@@ -205,10 +207,11 @@ def run_experiment(functions, experiments, outDir):
                 runList.append(callPipelineExperiment(functions, experiments))
             else:
                 runList.append(callExperiment([func], exp))
+            histogramList.append(getLatencyHistograms())
 
             if runList[i] != None:
                 print("Test complete! Generating report...")
-                partestResult = report(runList[i], exp)
+                partestResult = report(runList[i], exp, histogramList[i])
 
                 print(partestResult)
 
@@ -222,10 +225,16 @@ def run_experiment(functions, experiments, outDir):
         if (combineSheets):
             print("Generating Combined Report:")
             finalRunList = []
+            finalHistograms = {}
             for i in range(iterations):
                 if (i > warmupBuffer - 1):
                     if runList[i] == None:
                         continue
+                    for metric in histogramList[i]:
+                        if metric in finalHistograms:
+                            finalHistograms[metric].merge(histogramList[i][metric])
+                        else:
+                            finalHistograms[metric] = histogramList[i][metric]
                     for run in runList[i]:
                         run['iteration'] = i
                         if 'vmID' in run:
@@ -233,7 +242,7 @@ def run_experiment(functions, experiments, outDir):
                     finalRunList.extend(runList[i])
             print(str(finalRunList))
             if (len(finalRunList) > 0):
-                partestResult = report(finalRunList, exp)
+                partestResult = report(finalRunList, exp, finalHistograms)
 
                 baseFileName = outDir + "/" + functionName + "-" + str(
                         expName) + "-" + str(mem) + "MBs-COMBINED"
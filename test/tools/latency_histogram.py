@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+#
+# A mergeable HDR style latency histogram. Values are recorded in whole microseconds with
+# 3 significant digits, so percentiles are within 0.1% of the recorded values while memory
+# depends only on the range of values and not on the number of values recorded. Histograms
+# recorded by separate workers or iterations can be merged by adding their counts.
+#
+class LatencyHistogram:
+
+    # Each power of 2 range is split into 1024 linear sub buckets.
+    subBucketHalfCountMagnitude = 10
+    subBucketHalfCount = 1 << subBucketHalfCountMagnitude
+    subBucketMask = (1 << (subBucketHalfCountMagnitude + 1)) - 1
+
+    def __init__(self):
+        self.counts = {}
+        self.totalCount = 0
+        self.minValue = None
+        self.maxValue = 0
+
+    #
+    # Get the index of the bucket holding a value.
+    #
+    def getIndex(self, value):
+        bucketIndex = max(0, (value | self.subBucketMask).bit_length() - (self.subBucketHalfCountMagnitude + 1))
+        subBucketIndex = value >> bucketIndex
+        return ((bucketIndex + 1) << self.subBucketHalfCountMagnitude) + (subBucketIndex - self.subBucketHalfCount)
+
+    #
+    # Get the highest value that is held by a bucket.
+    #
+    def getHighestValue(self, index):
+        bucketIndex = (index >> self.subBucketHalfCountMagnitude) - 1
+        subBucketIndex = (index & (self.subBucketHalfCount - 1)) + self.subBucketHalfCount
+        if (bucketIndex < 0):
+            subBucketIndex -= self.subBucketHalfCount
+            bucketIndex = 0
+        return (subBucketIndex << bucketIndex) + (1 << bucketIndex) - 1
+
+    #
+    # Record a latency.
+    #
+    # @param value The latency in microseconds.
+    # @param count The number of times to record the latency.
+    #
+    def record(self, value, count = 1):
+        value = max(0, int(value))
+        index = self.getIndex(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.totalCount += count
+        if (self.minValue == None or value < self.minValue):
+            self.minValue = value
+        if (value > self.maxValue):
+            self.maxValue = value
+
+    #
+    # Record a latency and correct for coordinated omission. When a call takes longer than
+    # the expected interval between calls, the calls that a stalled closed loop worker did
+    # not send are recorded with the latencies they would have seen.
+    #
+    # @param value The latency in microseconds.
+    # @param expectedInterval The expected time between calls in microseconds.
+    #
+    def recordCorrected(self, value, expectedInterval):
+        self.record(value)
+        if (expectedInterval <= 0):
+            return
+        missing = value - expectedInterval
+        while (missing >= expectedInterval):
+            self.record(missing)
+            missing -= expectedInterval
+
+    #
+    # Add the counts of another histogram to this histogram.
+    #
+    def merge(self, other):
+        for index in other.counts:
+            self.counts[index] = self.counts.get(index, 0) + other.counts[index]
+        self.totalCount += other.totalCount
+        if (other.minValue != None and (self.minValue == None or other.minValue < self.minValue)):
+            self.minValue = other.minValue
+        if (other.maxValue > self.maxValue):
+            self.maxValue = other.maxValue
+        return self
+
+    #
+    # Get the values at a list of ascending percentiles in microseconds.
+    #
+    def getPercentiles(self, percentiles):
+        values = []
+        if (self.totalCount == 0):
+            return [0 for percentile in percentiles]
+        indexes = sorted(self.counts)
+        position = 0
+        seen = self.counts[indexes[0]]
+        for percentile in percentiles:
+            target = max(1, -(-self.totalCount * percentile // 100))
+            while (seen < target and position < len(indexes) - 1):
+                position += 1
+                seen += self.counts[indexes[position]]
+            values.append(min(self.getHighestValue(indexes[position]), self.maxValue))
+        return values
+
+    #
+    # Summarize the histogram with the number of values and the p50, p90, p99, p99.9
+    # and maximum latencies in ms.
+    #
+    def summary(self):
+        p50, p90, p99, p999 = self.getPercentiles([50, 90, 99, 99.9])
+        return {'count': self.totalCount, 'p50': p50 / 1000, 'p90': p90 / 1000, 'p99': p99 / 1000,
+                'p99.9': p999 / 1000, 'max': self.maxValue / 1000}
@@ -16,9 +16,12 @@ from decimal import Decimal
 #
 # Reports can be broken into groups.
 #
+# Client latency histograms recorded by experiment_caller may be passed in histograms
+# to add their percentiles to the report.
+#
 # @author Robert Cordingly
 #
-def report(responses, exp):
+def report(responses, exp, histograms=None):
     print("\n-----------------------------------------------------------------")    
     print("GENERATING REPORT... (report_generator.py)")
     print("-----------------------------------------------------------------\n")
@@ -197,6 +200,16 @@ def report(responses, exp):
         output += line + "\n"
     output += "Successful Runs: " + str(len(run_results)) + "\n"
 
+    #
+    # Percentiles of client latency histograms.
+    #
+    if histograms:
+        output += "\nClient latency percentiles (ms):\n"
+        output += "metric,count,p50,p90,p99,p99.9,max\n"
+        for metric in histograms:
+            summary = histograms[metric].summary()
+            output += metric + "," + ",".join([str(summary[key]) for key in ['count', 'p50', 'p90', 'p99', 'p99.9', 'max']]) + "\n"
+
     #
     # Purge runs list of runs with specific invalid parameters or duplicate containers.
     #